@@ -6,8 +6,12 @@ from django.utils.decorators import method_decorator
 from django.views.generic import View
 from django.http import JsonResponse
 from django.templatetags.static import static
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 
 from job.models import *
+from job.registry import statuses
 from ticketing.models import Ticket
 from payment.models import PromotionPackage
 from users.decorators import blocked_validation
@@ -64,11 +68,16 @@ class DashboardView(View):
     def get(self, request, *args, **kwargs):
 
         latest_tickets = Ticket.objects.order_by('-date_modified').filter(user=request.user)
-        deleted_status = JobStatus.objects.filter(name='deleted').first()
+        deleted_status = statuses.get('deleted')
         latest_jobs = Job.objects.order_by('-date_modified').filter(user=request.user).exclude(status=deleted_status)
         payment_packages = PromotionPackage.objects.all()
 
+        chart_years = [date.year for date in Job.objects.filter(user=request.user).dates('date_created', 'year')]
+        if timezone.now().year not in chart_years:
+            chart_years.append(timezone.now().year)
+
         context = {'user': request.user,
+                   'chart_years': sorted(chart_years, reverse=True),
                    'latest_tickets': latest_tickets,
                    'latest_jobs': latest_jobs,
                    'payment_packages': payment_packages}
@@ -79,7 +88,14 @@ class DashboardView(View):
                       )
 
 
-def get_monthly_account_stats(temp_chart, request):
+def get_chart_year(request):
+    try:
+        return int(request.GET.get('year', ''))
+    except ValueError:
+        return timezone.now().year
+
+
+def get_monthly_account_stats(temp_chart, request, year):
     month_list = ['January',
                   'February',
                   'March',
@@ -92,21 +108,18 @@ def get_monthly_account_stats(temp_chart, request):
                   'October',
                   'November',
                   'December']
-    frames_data = []
-    cost_data = []
-
-    for idx, month in enumerate(month_list):
-        completed_jobs = Job.objects.filter(user=request.user).filter(date_created__month=str(idx+1))
-
-        total_frames = 0
-        total_cost = 0.0
+    frames_data = [0] * len(month_list)
+    cost_data = [0.0] * len(month_list)
 
-        for job in completed_jobs:
-            total_frames += job.frames_count
-            total_cost += job.cost
+    monthly_stats = (Job.objects.filter(user=request.user, date_created__year=year)
+                     .annotate(month=TruncMonth('date_created'))
+                     .values('month')
+                     .annotate(total_frames=Sum('frame_count'), total_cost=Sum('cost'))
+                     .order_by('month'))
 
-        frames_data.append(total_frames)
-        cost_data.append(round(total_cost, 2))
+    for stats in monthly_stats:
+        frames_data[stats['month'].month - 1] = stats['total_frames'] or 0
+        cost_data[stats['month'].month - 1] = round(stats['total_cost'] or 0.0, 2)
 
     temp_chart['xAxis']['categories'] = month_list
     temp_chart['series'][0]['data'] = frames_data
@@ -134,7 +147,7 @@ def get_account_chart(request):
               ]
 
     acc_chart_cfg['series'] = series
-    chart = get_monthly_account_stats(acc_chart_cfg, request)
+    chart = get_monthly_account_stats(acc_chart_cfg, request, get_chart_year(request))
 
     return JsonResponse(chart)
 
@@ -161,15 +174,16 @@ def get_job_chart(request):
       'borderWidth': 1}]
     """
 
-    rendering_status = JobStatus.objects.filter(name='rendering').first()
-    completed_status = JobStatus.objects.filter(name='completed').first()
-    failed_status = JobStatus.objects.filter(name='failed').first()
-    suspended_status = JobStatus.objects.filter(name='suspended').first()
+    rendering_status = statuses.get('rendering')
+    completed_status = statuses.get('completed')
+    failed_status = statuses.get('failed')
+    suspended_status = statuses.get('suspended')
 
-    count_rendering = Job.objects.filter(user=request.user, status=rendering_status).count()
-    count_completed = Job.objects.filter(user=request.user, status=completed_status).count()
-    count_failed = Job.objects.filter(user=request.user, status=failed_status).count()
-    count_suspended = Job.objects.filter(user=request.user, status=suspended_status).count()
+    status_counts = Job.status_counts(request.user)
+    count_rendering = status_counts.get(rendering_status.pk, 0)
+    count_completed = status_counts.get(completed_status.pk, 0)
+    count_failed = status_counts.get(failed_status.pk, 0)
+    count_suspended = status_counts.get(suspended_status.pk, 0)
 
     labels = [rendering_status.display_name,
               completed_status.display_name,
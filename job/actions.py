@@ -0,0 +1,109 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from job.models import Job
+from job.registry import statuses
+from job.projections import select_job_relations, get_admin_payload, get_admin_event_profile
+from system import outbox, presence
+
+logger = logging.getLogger('JobsSocket')
+
+
+class JobAction:
+    """ a status change users can request for many jobs at once from the job list """
+
+    def __init__(self, target_status, is_allowed, admin_event, slack_event=None):
+        self.target_status = target_status
+        self.is_allowed = is_allowed
+        self.admin_event = admin_event
+        self.slack_event = slack_event
+
+
+# the side effects mirror the Job status signals of the target status
+job_actions = {'delete': JobAction('deleted', lambda status: status.is_deletable, 'on_deleted'),
+               'suspend': JobAction('suspending', lambda status: status.is_suspendable, 'on_suspended',
+                                    slack_event='on_suspending'),
+               'resume': JobAction('resuming', lambda status: status.name == 'suspended', 'on_rendering')}
+
+
+class JobActionResult:
+
+    def __init__(self, target_status):
+        self.target_status = target_status
+        self.changed = []
+        self.missing = []
+        self.unchanged = []
+        self.rejected = []
+
+
+def apply_job_action(user, job_names, action_name):
+    """
+    apply a job action to the named jobs of a user with one locked fetch and one
+    update in a single transaction, then queue one admin broadcast and send one
+    job list update for the whole batch.
+    """
+    action = job_actions[action_name]
+    target_status = statuses.get(action.target_status)
+    result = JobActionResult(target_status)
+    job_names = [name for name in job_names if name]
+
+    with transaction.atomic():
+        jobs = select_job_relations(Job.objects.filter(user=user, name__in=job_names)).select_for_update(of=('self',))
+        jobs_by_name = {job.name: job for job in jobs}
+
+        for name in job_names:
+            job = jobs_by_name.get(name)
+            if not job:
+                result.missing.append(name)
+            elif job.status_id == target_status.pk:
+                result.unchanged.append(job)
+            elif not job.status or not action.is_allowed(job.status):
+                result.rejected.append(job)
+            else:
+                result.changed.append(job)
+
+        if result.changed:
+            Job.objects.filter(pk__in=[job.pk for job in result.changed]).update(status=target_status,
+                                                                                revision=F('revision') + 1,
+                                                                                date_modified=timezone.now())
+            for job in result.changed:
+                job.status = target_status
+                job.revision += 1
+                job._loaded_state = job._get_tracked_state()
+
+            notify_job_action(user, action, result.changed)
+
+    logger.debug(f"job action {action_name} : {user.username} >> {len(result.changed)} changed, "
+                 f"{len(result.rejected)} rejected, {len(result.missing)} missing")
+    return result
+
+
+def notify_job_action(user, action, jobs):
+    profile = get_admin_event_profile(action.admin_event)
+    admin_messages = [{'type': 'send_message', 'action': action.admin_event, 'data': get_admin_payload(job, profile)}
+                      for job in jobs]
+    outbox.enqueue_group_send_many(action.admin_event, 'admin', admin_messages, user=user)
+
+    if action.slack_event:
+        data = {'user': user.username, 'jobs': ", ".join(job.name for job in jobs)}
+        outbox.enqueue_slack(action.slack_event, action.slack_event, action.slack_event, data, user=user)
+
+    if not presence.is_listening('jobs', user.id):
+        return
+
+    data = {'type': 'send_message', 'action': 'update_jobs'}
+    if action.target_status == 'deleted':
+        data['deleted'] = [job.id for job in jobs]
+    else:
+        data['jobs'] = [{'job_id': job.id, 'html': render_to_string('job/widgets/job_item.html', context={'job': job})}
+                        for job in jobs]
+
+    # sent once the change is committed so the job list never shows a rolled back status
+    transaction.on_commit(lambda: async_to_sync(get_channel_layer().group_send)(
+        presence.user_group('jobs', user.id), data))
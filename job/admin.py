@@ -52,6 +52,7 @@ class SoftwareVersionAdmin(admin.ModelAdmin):
 class JobTaskInlineAdmin(admin.StackedInline):
     model = JobTask
     extra = 0
+    readonly_fields = ['frame_count']
 
 
 class SoftwareAdmin(admin.ModelAdmin):
@@ -85,6 +86,8 @@ class JobAdmin(AdminChangeLinksMixin, AdminAdvancedFiltersMixin, admin.ModelAdmi
     resubmit_job.short_description = "Re-submit"
     change_links = ['user', 'user_profile']
     list_display_links = ['name']
+    # kept by update_counters and the compare and swap save, a hand edit would break both
+    readonly_fields = ['frame_count', 'revision']
 
     formfield_overrides = {models.JSONField: {'widget': JSONEditorWidget}, }
 
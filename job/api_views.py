@@ -1,18 +1,179 @@
 import logging
 import ast
+import hashlib
 from pprint import pformat
 
 from rest_framework.views import APIView
 from rest_framework import authentication, permissions
 from rest_framework.response import Response
 from rest_framework import status
+from django.db.models import Q
 from django.http import Http404
+from django.utils.http import parse_etags, quote_etag
 
 from job.models import *
 from job.serializers import *
+from job.ingestion import ingest_task_reports
+from job.error_matcher import get_error_matcher
+from job.registry import statuses, plans, output_formats
+from job import progress as job_progress
+from job.projections import PAYLOAD_PROFILES, get_admin_payload
+from users.models import Profile
+from rendershot_django.pagination import encode_cursor, decode_cursor
+
+
+def load_json(value):
+    """ report fields are json strings when posted as form data, and already loaded in a json body """
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class JobReportMixin:
+    """ farm job reports, shared by the single job and the batch endpoints """
+
+    def apply_reports(self, reports):
+        """
+        apply (job, data) farm reports, the profile and ledger of every user are read once.
+        each report runs in its own savepoint : task reports and counters, then the field
+        changes checked against the user balance. a report that fails is rolled back as a
+        whole and only fails its own job. returns a result per report, with the jobs auto
+        suspended for a negative balance.
+        """
+        deleted_status = statuses.get('deleted')
+        accounts = Profile.get_accounts({job.user_id for job, data in reports})
+
+        results = []
+        for job, data in reports:
+            result = {'job_name': job.name, 'result': 'updated', 'suspended': False}
+            results.append(result)
+            if job.status_id == deleted_status.pk:
+                self.log.warning(f"job is already deleted, returning : {job.name} >> {job.status}")
+                result['result'] = 'deleted'
+            else:
+                self.apply_isolated(job, data, accounts.get(job.user_id), result)
+            result['status'] = job.status.name if job.status else None
+
+        return results
+
+    def apply_isolated(self, job, data, account, result):
+        try:
+            with transaction.atomic():
+                cost = job.cost or float()
+                self.apply_counters(job, data)
+                spent = (job.cost or float()) - cost
+
+                user_balance = account[0].get_ledger_balance(account[1], spent) if account else float()
+                self.apply_report(job, data, user_balance, result)
+        except Exception as err:
+            self.log.exception(f"job report failed : {job.name} >> {err}")
+            result.update({'result': 'error', 'error': str(err)})
+            job.refresh_from_db()
+            return
+
+        # later reports of the same user see the cost of this one
+        if account:
+            account[1].spent_amount += spent
+
+    def apply_report(self, job, data, user_balance, result):
+        # heartbeats skip the save, a negative balance still goes through it to suspend the job
+        if job_progress.is_progress_only(job, data) and user_balance >= 0:
+            job_progress.buffer_progress(job, data)
+            result['result'] = 'buffered'
+            return
+
+        was_suspended = job.status and job.status.name == 'suspended'
+        pending_fields = job_progress.pop_pending(job)
+        job.save_changes(lambda changed_job: self.apply_changes(changed_job, data, pending_fields, user_balance),
+                         operator='api')
+        result['suspended'] = bool(user_balance < 0 and not was_suspended and job.status.name == 'suspended')
+
+    def apply_counters(self, job, data):
+        """ task reports, errors and cost of a farm report, applied once in the database """
+        if job_progress.is_progress_only(job, data):
+            return
+
+        new_deadline_tasks_count = data.get('tasks_count')
+        if new_deadline_tasks_count and int(new_deadline_tasks_count) != int(job.deadline_tasks_count):
+            job.jobtask_set.all().delete()
+            job.update_counters(reset=True, cost=float(), frame_count=0)
+            self.log.debug(f"tasks discrepancy triggered : {job.deadline_tasks_count} >> {new_deadline_tasks_count}")
+
+        new_errors = data.get('errors')
+        if new_errors:
+            add_errors = []
+            new_errors = load_json(new_errors)
+            self.log.debug(f"list of errors sent : {pformat(new_errors)}")
+            software_id = job.software_version.software_id if job.software_version else None
+            error_matcher = get_error_matcher(software_id)
+            for error_id, error_message in new_errors.items():
+                for error in error_matcher.match(error_message):
+                    if error not in add_errors:
+                        add_errors.append(error)
+                        self.log.info(f'job error found {error}.')
+
+            if add_errors:
+                self.log.info(f'adding {len(add_errors)} to job.')
+                job.error.add(*add_errors)
+
+        new_tasks = data.get('tasks')
+        if new_tasks:
+            new_tasks = load_json(new_tasks)
+            total_cost = ingest_task_reports(job, new_tasks)
+
+            if job.is_gpu:
+                total_cost = total_cost * 3
+
+            # cost is added in the database, overlapping reports of the same job are all counted
+            if int(new_deadline_tasks_count) == 1:
+                job.update_counters(reset=True, cost=total_cost)
+            else:
+                job.update_counters(cost=total_cost)
+
+    def apply_changes(self, job, data, pending_fields, user_balance):
+        """ field changes of a farm update, applied again on a reloaded job when another writer saved it first """
+        for name, value in pending_fields.items():
+            setattr(job, name, value)
+
+        new_status = data.get('status')
+        new_status_object = statuses.get(new_status)
+        if new_status_object:
+            if job.status.name == 'deleted':
+                self.log.debug(f"do not update status, job is deleted : {job.name} >> {job.status.name}")
+            elif job.status.name == 'resuming' and not new_status_object.name == 'rendering':
+                self.log.debug(f"rendering status expected {job.name} >> {new_status}")
+                if new_status_object.name in ['failed', 'completed']:
+                    job.status = new_status_object
+                    self.log.debug(f"set new status : {job.name} >> {new_status}")
+            elif job.status.name == 'suspending' and not new_status_object.name == 'suspended':
+                self.log.debug(f"suspended status expected {job.name} >> {new_status}")
+                if new_status_object.name in ['failed', 'completed']:
+                    job.status = new_status_object
+                    self.log.debug(f"set new status : {job.name} >> {new_status}")
+            else:
+                job.status = new_status_object
+                self.log.debug(f"set new status : {job.name} >> {new_status}")
 
+        new_progress = data.get('progress')
+        if new_progress:
+            job.progress = new_progress
+            self.log.debug(f"set new progress : {job.name} >> {new_progress}")
 
-class JobAPI(APIView):
+        new_deadline_id = data.get('deadline_id')
+        if new_deadline_id:
+            job.deadline_id = new_deadline_id
+            self.log.debug(f"set new deadline_id : {job.name} >> {new_deadline_id}")
+
+        new_deadline_tasks_count = data.get('tasks_count')
+        if new_deadline_tasks_count:
+            job.deadline_tasks_count = new_deadline_tasks_count
+            self.log.debug(f"set new deadline_tasks_count : {job.name} >> {new_deadline_tasks_count}")
+
+        # suspend job if user balance is not positive
+        if 0 > user_balance and not job.status.name == 'deleted':
+            job.status = statuses.get('suspended')
+            self.log.debug(f"suspended job  for negative credit : {job.name} >> {job.status} >> {user_balance}")
+
+
+class JobAPI(JobReportMixin, APIView):
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
@@ -28,7 +189,12 @@ class JobAPI(APIView):
 
     def get(self, request, *args, **kwargs):
         job = self.get_object(request.data.get('job_name', ''))
-        serializer = JobSerializer(job)
+
+        profile = request.query_params.get('profile', 'full')
+        if profile not in PAYLOAD_PROFILES:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = JobSerializer(job, profile=profile)
         return Response(serializer.data)
 
     def build_frame_list(self, frames):
@@ -55,14 +221,14 @@ class JobAPI(APIView):
         file_storage = FileStorage.objects.filter(name='RenderShare').first()
 
         # get and validate render plan
-        render_plan = RenderPlan.objects.filter(pk=posted_system_info.get('render_plan')).first()
+        render_plan = plans.get_by_pk(posted_system_info.get('render_plan'))
         unlimited_allowed = not self.request.user.profile.rate_multiplier
         if render_plan.name == 'unlimited' and not unlimited_allowed:
             self.log.warning(f'unlimited plan selected but not authorized : {render_plan.name} >> {unlimited_allowed}')
-            render_plan = RenderPlan.objects.filter(name='animation_slow').first()
+            render_plan = plans.get('animation_slow')
             self.log.debug(f'auto switching plan to {render_plan}')
 
-        output_format = OutputFormat.objects.filter(extension=posted_system_info.get('output_format')).first()
+        output_format = output_formats.get(posted_system_info.get('output_format'))
         frame_list = self.build_frame_list(posted_job_info.get('Frames'))
 
         system_info = dict(plugin_name=version.plugin_name,
@@ -102,7 +268,7 @@ class JobAPI(APIView):
             'render_plan': render_plan,
             'file_storage': file_storage,
             'output_format': output_format,
-            'status': JobStatus.objects.filter(name='submitted').first(),
+            'status': statuses.get('submitted'),
             'progress': float(),
             'software_version': version,
             'data': job_schema,
@@ -111,7 +277,7 @@ class JobAPI(APIView):
         job = Job.objects.create(**initial)
         job.save(operator='api')
 
-        serializer = JobSerializer(job)
+        serializer = JobSerializer(job, profile='farm')
         return Response(serializer.data)
 
     def put(self, request, *args, **kwargs):
@@ -121,125 +287,117 @@ class JobAPI(APIView):
         self.log.debug(pformat(data))
 
         self.log.debug(f"requested job found : {job.name}")
-        if job.status == JobStatus.objects.filter(name='deleted').first():
-            self.log.warning(f"job is already deleted, returning : {job.name} >> {job.status}")
-            serializer = JobSerializer(job)
-            return Response(serializer.data)
+        result = self.apply_reports([(job, data)])[0]
+        if result['result'] == 'error':
+            return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
 
-        new_status = data.get('status')
-        if new_status in [status.name for status in JobStatus.objects.all()]:
-            new_status_object = JobStatus.objects.filter(name=new_status).first()
-            if job.status.name == 'deleted':
-                self.log.debug(f"do not update status, job is deleted : {job.name} >> {job.status.name}")
-            elif job.status.name == 'resuming' and not new_status_object.name == 'rendering':
-                self.log.debug(f"rendering status expected {job.name} >> {new_status}")
-                if new_status_object.name in ['failed', 'completed']:
-                    job.status = new_status_object
-                    self.log.debug(f"set new status : {job.name} >> {new_status}")
-            elif job.status.name == 'suspending' and not new_status_object.name == 'suspended':
-                self.log.debug(f"suspended status expected {job.name} >> {new_status}")
-                if new_status_object.name in ['failed', 'completed']:
-                    job.status = new_status_object
-                    self.log.debug(f"set new status : {job.name} >> {new_status}")
+        serializer = JobSerializer(job, profile='farm')
+        return Response(serializer.data)
+
+
+class JobBatchAPI(JobReportMixin, APIView):
+    """ reports of many jobs in one request : {"jobs": [{"job_name": ..., "status": ..., "tasks": ...}, ...]} """
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def __init__(self):
+        super(JobBatchAPI, self).__init__()
+        self.log = logging.getLogger('JobAPI')
+
+    def put(self, request, *args, **kwargs):
+        reports = load_json(request.data.get('jobs')) or []
+        if not isinstance(reports, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        # a report has to be an object naming its job, anything else fails on its own
+        valid_reports = [isinstance(report, dict) and isinstance(report.get('job_name'), str) for report in reports]
+        job_names = {report['job_name'] for report, is_valid in zip(reports, valid_reports) if is_valid}
+        jobs = dict()
+        # keep the lowest id per name, like the single job lookup of older jobs
+        for job in Job.objects.filter(name__in=job_names).select_related('user', 'status', 'render_plan',
+                                                                           'software_version').order_by('-id'):
+            jobs[job.name] = job
+
+        found_reports = [(jobs[report['job_name']], report) for report, is_valid in zip(reports, valid_reports)
+                         if is_valid and report['job_name'] in jobs]
+        self.log.debug(f"batch report : {len(reports)} reports, {len(found_reports)} jobs found")
+
+        with transaction.atomic():
+            results = iter(self.apply_reports(found_reports))
+
+        job_results = []
+        for report, is_valid in zip(reports, valid_reports):
+            if not is_valid:
+                job_results.append({'job_name': report.get('job_name') if isinstance(report, dict) else None,
+                                    'result': 'error', 'error': 'report is not an object with a job_name',
+                                    'suspended': False, 'status': None})
+            elif report['job_name'] in jobs:
+                job_results.append(next(results))
             else:
-                job.status = new_status_object
-                self.log.debug(f"set new status : {job.name} >> {new_status}")
+                job_results.append({'job_name': report.get('job_name'), 'result': 'missing', 'suspended': False,
+                                    'status': None})
 
-        new_progress = data.get('progress')
-        if new_progress:
-            job.progress = new_progress
-            self.log.debug(f"set new progress : {job.name} >> {new_progress}")
+        return Response({'jobs': job_results})
 
-        new_deadline_id = data.get('deadline_id')
-        if new_deadline_id:
-            job.deadline_id = new_deadline_id
-            self.log.debug(f"set new deadline_id : {job.name} >> {new_deadline_id}")
 
-        new_deadline_tasks_count = data.get('tasks_count')
-        if new_deadline_tasks_count and int(new_deadline_tasks_count) != int(job.deadline_tasks_count):
-            job.jobtask_set.all().delete()
-            job.cost = float()
-            self.log.debug(f"tasks discrepancy triggered : {job.deadline_tasks_count} >> {new_deadline_tasks_count}")
+class JobSpecAPI(APIView):
+    """ full job spec, with the v2 scene dump left out of broadcasts, pulled by the farm once per submission """
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
 
-        if new_deadline_tasks_count:
-            job.deadline_tasks_count = new_deadline_tasks_count
-            self.log.debug(f"set new deadline_tasks_count : {job.name} >> {new_deadline_tasks_count}")
+    def get(self, request, *args, **kwargs):
+        job = Job.objects.filter(name=request.query_params.get('job_name', '')).order_by('id').first()
+        if not job:
+            raise Http404
 
-        new_errors = data.get('errors')
-        if new_errors:
-            add_errors = []
-            new_errors = json.loads(data.get('errors'))
-            self.log.debug(f"list of errors sent : {pformat(new_errors)}")
-            for error_id, error_message in new_errors.items():
-                # ultimately we need to filter this per software
-                for error in JobError.objects.all():
-                    if error.error in error_message:
-                        add_errors.append(error)
-                        self.log.info(f'job error found {error.error}.')
+        return Response(get_admin_payload(job, 'full'))
 
-            if add_errors:
-                self.log.info(f'adding {len(add_errors)} to job.')
-                job.error.add(*add_errors)
 
-        new_tasks = data.get('tasks')
-        if new_tasks:
-            total_cost = float()
-            new_tasks = json.loads(data.get('tasks'))
-            for task_id, task_data in new_tasks.items():
-                task_id = int(task_id)
-                new_cpu_usage = task_data.get('cpu_usage')
-                new_frame_list = task_data.get('frame_list')
-
-                new_render_time = float(task_data.get('render_time'))
-                # exception handling for bad render time data from deadline
-                if new_render_time > 2000:
-                    self.log.debug(f"bad deadline render time report : {job.name} >> {new_render_time}")
-                    continue
-
-                new_render_time_string = task_data.get('render_time_string')
-                new_cost = new_render_time * job.render_plan.rate_per_min
-                total_cost += new_cost
-
-                exist_task = job.jobtask_set.filter(deadline_task_id=task_id).first()
-                if exist_task:
-                    exist_task.cost = new_cost
-                    exist_task.cpu_usage = new_cpu_usage
-                    exist_task.frame_list = new_frame_list
-                    exist_task.render_time = new_render_time
-                    exist_task.render_time_string = new_render_time_string
-
-                    exist_task.save()
-                else:
-                    initial = {'job': job,
-                               'deadline_task_id': task_id,
-                               'cost': new_cost,
-                               'cpu_usage': new_cpu_usage,
-                               'frame_list': new_frame_list,
-                               'render_time': new_render_time,
-                               'render_time_string': new_render_time_string}
-
-                    new_task = JobTask.objects.create(**initial)
-                    new_task.save()
+class JobStatusAPI(APIView):
+    """
+    slim status records of the user jobs, asked by name (?names=a,b) or changed since a
+    cursor (?since=<cursor>, empty for every job). the cursor is the (date_modified, id)
+    of the last record sent, jobs written within the same timestamp are ordered by id so
+    none of them is skipped. the etag is built from the job revisions alone, so an
+    unchanged poll is answered with a 304 and nothing serialized.
+    """
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
 
-            if int(new_deadline_tasks_count) == 1:
-                job_current_cost = float()
-            else:
-                job_current_cost = job.cost
+    max_jobs = 500
 
-            if job.is_gpu:
-                total_cost = total_cost * 3
+    def get(self, request, *args, **kwargs):
+        jobs = Job.objects.filter(user=request.user)
+
+        names = [name for name in request.query_params.get('names', '').split(',') if name]
+        since = request.query_params.get('since')
+        if names:
+            jobs = jobs.filter(name__in=names[:self.max_jobs])
+        elif since is not None:
+            cursor = decode_cursor(since)
+            if cursor and cursor[0]:
+                date_modified, pk = cursor
+                jobs = jobs.filter(Q(date_modified__gt=date_modified) | Q(date_modified=date_modified, id__gt=pk))
+        else:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-            job.cost = job_current_cost + total_cost
+        jobs = jobs.order_by('date_modified', 'id')
+        versions = list(jobs.only('id', 'revision', 'date_modified')[:self.max_jobs])
+        etag = self.get_etag(request, versions)
+        headers = {'ETag': etag}
 
-        # suspend job if user balance is not positive
-        user_balance = job.user.profile.balance
-        if 0 > job.user.profile.balance and not job.status.name == 'deleted':
-            job.status = JobStatus.objects.filter(name='suspended').first()
-            self.log.debug(f"suspended job  for negative credit : {job.name} >> {job.status} >> {user_balance}")
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        job.save(operator='api')
-        serializer = JobSerializer(job)
-        return Response(serializer.data)
+        records = jobs.filter(id__in=[job.id for job in versions]).select_related('status')
+        next_cursor = encode_cursor(versions[-1], field='date_modified') if versions else since
+        return Response({'jobs': JobStatusSerializer(records, many=True).data, 'cursor': next_cursor},
+                        headers=headers)
+
+    def get_etag(self, request, versions):
+        state = ",".join(f"{job.id}:{job.revision}" for job in versions)
+        return quote_etag(hashlib.sha1(f"{request.get_full_path()}|{state}".encode()).hexdigest())
 
 
 class SubmitSessionAPI(APIView):
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class JobConfig(AppConfig):
     name = 'job'
 
+    def ready(self):
+        # connect the JobError and reference registry cache invalidation signals
+        import job.error_matcher
+        import job.registry
+
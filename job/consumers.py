@@ -1,13 +1,22 @@
-import requests
+import asyncio
 import logging
 import pprint
 
-from channels.generic.websocket import WebsocketConsumer
+import aiohttp
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
 
 from job.models import *
 from job.forms import KeyShotJobForm
 from job import utils as job_utils
+from job.registry import statuses, plans
+from job.actions import apply_job_action
 from system.dbx_utils import DropboxHandler
+from system import presence
+
+# connect and total timeouts in seconds for source file link checks
+LINK_CHECK_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3.05)
 
 
 class SocketMessage:
@@ -44,12 +53,24 @@ def get_json_messages(messages):
     return json.dumps(message_data)
 
 
-class JobsConsumer(WebsocketConsumer):
+async def get_link_status(url):
+    async with aiohttp.ClientSession(timeout=LINK_CHECK_TIMEOUT) as session:
+        async with session.head(url, allow_redirects=False) as response:
+            return response.status
+
+
+class JobsConsumer(AsyncWebsocketConsumer):
+    """
+    job list socket, actions run their database work through database_sync_to_async
+    and return the messages to send, so no socket pins a thread while it waits.
+    """
 
     def __init__(self, *args, **kwargs):
-        super(JobsConsumer, self).__init__()
+        super(JobsConsumer, self).__init__(*args, **kwargs)
         self.log = logging.getLogger('JobsSocket')
         self.group_name = 'jobs'
+        self.user_group = ''
+        self.presence_heartbeat = None
         self.actions = {'request_delete_jobs': self.request_delete_jobs,
                         'request_suspend_jobs': self.request_suspend_jobs,
                         'request_pause_resume': self.request_pause_resume,
@@ -63,89 +84,80 @@ class JobsConsumer(WebsocketConsumer):
                         'update_version_dependencies': self.update_version_dependencies,
                         'get_select_file_modal': self.get_select_file_modal}
 
-    def connect(self):
-        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
-        self.accept()
+    async def connect(self):
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
 
         if self.scope['user'].is_anonymous:
             self.log.debug(f'anonymous user detected. closing socket.')
-            self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
-            self.close(3001)
+            await self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
+            await self.close(3001)
             return
         if not isinstance(self.scope['user'], User):
             self.log.debug(f'user is not a valid system User instance. closing socket.')
-            self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
-            self.close(3001)
+            await self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
+            await self.close(3001)
             return
 
-        socket_conn = SocketConnection.objects.create(user=self.scope["user"],
-                                                      channel=self.channel_name,
-                                                      group=self.group_name)
-        socket_conn.save()
+        self.user_group = presence.user_group(self.group_name, self.scope['user'].id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await sync_to_async(presence.add, thread_sensitive=False)(self.group_name, self.scope['user'].id,
+                                                                  self.channel_name)
+        self.presence_heartbeat = asyncio.ensure_future(
+            presence.heartbeat(self.group_name, self.scope['user'].id, self.channel_name))
+
+        await self.send(text_data=json.dumps({'message': 'connected'}))
 
-        self.send(text_data=json.dumps({'message': 'connected'}))
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(self.group_name, self.channel_name)
+        if self.presence_heartbeat:
+            self.presence_heartbeat.cancel()
 
-        if isinstance(self.scope["user"], User):
-            socket_conn = SocketConnection.objects.filter(user=self.scope["user"],
-                                                          group=self.group_name,
-                                                          channel=self.channel_name).first()
-            if socket_conn:
-                socket_conn.delete()
+        if self.user_group:
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+            await sync_to_async(presence.remove, thread_sensitive=False)(self.group_name, self.scope['user'].id,
+                                                                         self.channel_name)
 
-        self.send(text_data=json.dumps({'message': 'disconnected'}))
+        await self.send(text_data=json.dumps({'message': 'disconnected'}))
 
-    def receive(self, text_data=None, bytes_data=None):
+    async def receive(self, text_data=None, bytes_data=None):
         data = json.loads(text_data)
         self.log.debug(pprint.pformat(data))
         action = self.actions.get(data.get('type', ''), '')
-        if action:
-            action(data)
-
-    def send_message(self, event):
-        self.send(text_data=json.dumps(event))
-
-    def get_status(self, **kwargs):
-        return JobStatus.objects.filter(**kwargs).first() or None
-
-    def get_plan(self, **kwargs):
-        return RenderPlan.objects.filter(**kwargs).first() or None
-
-    def get_jobs(self, data, messages, invalid_status=None):
-        jobs = []
-        for item in data.get('jobs'):
-            if not item:
-                continue
+        if not action:
+            return
 
-            job = Job.objects.filter(user=self.scope["user"], name=item).first()
-            if not job:
-                messages.append(add_message(f'Job {item} is no longer exist.', SocketMessage.warning))
-                continue
+        if asyncio.iscoroutinefunction(action):
+            replies = await action(data)
+        else:
+            replies = await database_sync_to_async(action)(data)
 
-            if invalid_status and job.status == invalid_status:
-                messages.append(add_message(f'Job is already {invalid_status.display_name}.', SocketMessage.warning))
-                continue
+        for reply in replies or []:
+            await self.send(text_data=reply)
 
-            jobs.append(job)
+    async def send_message(self, event):
+        await self.send(text_data=json.dumps(event))
 
-        if not jobs:
-            return self.send(text_data=get_json_messages(messages))
+    def get_status(self, name):
+        return statuses.get(name)
 
-        return jobs
+    def get_plan(self, pk, display_name):
+        plan = plans.get_by_pk(pk)
+        if plan and plan.display_name == display_name:
+            return plan
 
-    def get_job(self, data):
-        messages = []
+    def get_job(self, data, messages):
         job_name = data.get('job_name', '')
         if not job_name:
             messages.append(add_message(f'Job {job_name} could not be found.', SocketMessage.error))
-            return self.send(text_data=get_json_messages(messages))
+            return
 
-        job = Job.objects.filter(name=job_name).first()
+        job = Job.objects.select_related('status', 'render_plan', 'file_storage', 'output_format',
+                                         'software_version').filter(name=job_name).first()
         if not job:
             messages.append(add_message(f'Job {job_name} is not exist.', SocketMessage.error))
-            return self.send(text_data=get_json_messages(messages))
+            return
 
         return job
 
@@ -153,109 +165,104 @@ class JobsConsumer(WebsocketConsumer):
         if not target_plan or not isinstance(target_plan, RenderPlan):
             return
 
+        def apply_changes(changed_job):
+            if not changed_job.status.is_upgradable:
+                return False
+            changed_job.render_plan = target_plan
+
         for job in jobs:
-            if not job.status.is_upgradable:
+            if not job.save_changes(apply_changes, operator='web_user'):
                 messages.append(add_message(f'Job {job.name} plan can not be changed at this point.',
                                             SocketMessage.warning))
             else:
-                job.render_plan = target_plan
-                job.save(operator='web_user')
                 messages.append(add_message(f'Plan changed to {job.render_plan.display_name}.', SocketMessage.success))
 
-    def batch_change_status(self, jobs, messages, target_status):
-        if not target_status or not isinstance(target_status, JobStatus):
-            return
-
-        for job in jobs:
-            if target_status == self.get_status(name='deleted') and not job.status.is_deletable:
-                err_message = add_message(f'Job {job.name} can not be {target_status.display_name} at this point.',
-                                          SocketMessage.warning)
-                self.send(text_data=get_json_messages([err_message]))
-                continue
-            if target_status == self.get_status(name='suspending') and not job.status.is_suspendable:
-                err_message = add_message(f'Job {job.name} can not be {target_status.display_name} at this point.',
-                                          SocketMessage.warning)
-                self.send(text_data=get_json_messages([err_message]))
-                continue
-
-            job.status = target_status
-            job.save(operator='web_user')
-            success_message = add_message(f'Job {job.name} is {target_status.display_name}.', SocketMessage.success)
-            self.send(text_data=get_json_messages([success_message]))
-
     def batch_toggle_status(self, jobs, messages, base_status_list, target_status):
-        for job in jobs:
-            toggled = False
-            new_status = job.status
+        def apply_changes(changed_job):
+            if changed_job.status not in base_status_list:
+                return False
+            changed_job.status = target_status
 
-            if job.status in base_status_list:
-                job.status = target_status
-                new_status = target_status
-                toggled = True
-
-            if toggled:
-                job.save(operator='web_user')
-                messages.append(add_message(f'Job {job.name} is {new_status.display_name}.', SocketMessage.success))
+        for job in jobs:
+            if job.save_changes(apply_changes, operator='web_user'):
+                messages.append(add_message(f'Job {job.name} is {target_status.display_name}.', SocketMessage.success))
 
-    def request_delete_jobs(self, data):
+    def request_job_action(self, data, action_name):
         messages = []
-        target_status = self.get_status(name='deleted')
-        jobs = self.get_jobs(data, messages, invalid_status=target_status)
-        self.batch_change_status(jobs, messages, target_status)
+        result = apply_job_action(self.scope["user"], data.get('jobs') or [], action_name)
+        target_status = result.target_status
+
+        for name in result.missing:
+            messages.append(add_message(f'Job {name} is no longer exist.', SocketMessage.warning))
+        for job in result.unchanged:
+            messages.append(add_message(f'Job is already {target_status.display_name}.', SocketMessage.warning))
+        for job in result.rejected:
+            messages.append(add_message(f'Job {job.name} can not be {target_status.display_name} at this point.',
+                                        SocketMessage.warning))
+
+        if len(result.changed) == 1:
+            messages.append(add_message(f'Job {result.changed[0].name} is {target_status.display_name}.',
+                                        SocketMessage.success))
+        elif result.changed:
+            messages.append(add_message(f'{len(result.changed)} jobs are {target_status.display_name}.',
+                                        SocketMessage.success))
+
+        return [get_json_messages(messages)]
 
-        # return self.send(text_data=get_json_messages(messages))
+    def request_delete_jobs(self, data):
+        return self.request_job_action(data, 'delete')
 
     def request_suspend_jobs(self, data):
-        messages = []
-        target_status = self.get_status(name='suspending')
-        jobs = self.get_jobs(data, messages, invalid_status=target_status)
-        self.batch_change_status(jobs, messages, target_status)
-
-        # return self.send(text_data=get_json_messages(messages))
+        return self.request_job_action(data, 'suspend')
 
     def request_pause_resume(self, data):
-        messages = []
-        jobs = self.get_jobs(data, messages)
-        target_job = jobs[0]
-
-        if target_job.status in JobStatus.objects.filter(is_suspendable=True):
-            self.batch_change_status(jobs, messages, self.get_status(name='suspending'))
-        elif target_job.status == self.get_status(name='suspended'):
-            self.batch_change_status(jobs, messages, self.get_status(name='resuming'))
-
-        # return self.send(text_data=get_json_messages(messages))
+        job_names = [name for name in data.get('jobs') or [] if name]
+        target_job = Job.objects.filter(user=self.scope["user"], name__in=job_names[:1]).first()
+        if not target_job:
+            messages = [add_message(f'Job {name} is no longer exist.', SocketMessage.warning) for name in job_names]
+            return [get_json_messages(messages)]
+
+        # the first selected job decides whether the selection is paused or resumed
+        target_status = statuses.get_by_pk(target_job.status_id)
+        if target_status and target_status.is_suspendable:
+            return self.request_job_action(data, 'suspend')
+        elif target_status and target_status.name == 'suspended':
+            return self.request_job_action(data, 'resume')
 
     def request_delete_job(self, data):
         return self.request_delete_jobs(data)
 
     def get_job_details(self, data):
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        messages = []
+        job = self.get_job(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
 
         tasks = job.jobtask_set.order_by('deadline_task_id').all()
         html = render_to_string('job/job_details_modal.html',
                                 context={'job': job,
                                          'tasks': tasks})
         data = {'action': 'set_job_details', 'html': html}
-        return self.send(text_data=json.dumps(data))
+        return [json.dumps(data)]
 
     def get_job_error_reports(self, data):
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        messages = []
+        job = self.get_job(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
 
         errors = job.error.all()
         html = render_to_string('job/job_error_modal.html',
                                 context={'job': job,
                                          'errors': errors})
         data = {'action': 'set_job_error_reports', 'html': html}
-        return self.send(text_data=json.dumps(data))
+        return [json.dumps(data)]
 
     def get_change_plan(self, data):
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        messages = []
+        job = self.get_job(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
 
         plans = []
         if job.data.get('session_data'):
@@ -265,46 +272,48 @@ class JobsConsumer(WebsocketConsumer):
 
         html = render_to_string('job/change_plan_modal.html', context={'job': job, 'plans': plans})
         data = {'action': 'set_change_plan', 'html': html}
-        return self.send(text_data=json.dumps(data))
+        return [json.dumps(data)]
 
     def request_change_plan(self, data):
         messages = []
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        job = self.get_job(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
+
         target_plan = self.get_plan(display_name=data.get('plan_name', ''), pk=data.get('plan_id', ''))
         self.batch_change_plan([job, ], messages, target_plan)
 
-        return self.send(text_data=get_json_messages(messages))
+        return [get_json_messages(messages)]
 
     def get_resubmit_job(self, data):
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        messages = []
+        job = self.get_job(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
 
         html = render_to_string('job/resubmit_job_modal.html', context={'job': job})
         data = {'action': 'set_resubmit_job', 'html': html}
-        return self.send(text_data=json.dumps(data))
+        return [json.dumps(data)]
 
-    def request_resubmit_job(self, data):
+    async def request_resubmit_job(self, data):
         self.log.debug(data)
         messages = []
-        job = self.get_job(data)
-        if not isinstance(job, Job):
-            return
+        job = await database_sync_to_async(self.get_job)(data, messages)
+        if not job:
+            return [get_json_messages(messages)]
 
         frame_list = data.get('frame_list', '')
         frame_list_message = 'Entered frame list is not valid.'
         if not frame_list:
             messages.append(add_message(frame_list_message, SocketMessage.error))
             self.log.debug(f'{frame_list_message} >> {frame_list}')
-            return self.send(text_data=get_json_messages(messages))
+            return [get_json_messages(messages)]
 
         result = job_utils.validate_frame_list(frame_list.split(","))
         if isinstance(result, str):
             messages.append(add_message(frame_list_message, SocketMessage.error))
             self.log.debug(f'{result} >> {frame_list}')
-            return self.send(text_data=get_json_messages(messages))
+            return [get_json_messages(messages)]
 
         if job.file_storage.name.lower() == "dropbox":
             dbx_download_link = job.data.get('file_info').get('absolute_url')
@@ -312,22 +321,29 @@ class JobsConsumer(WebsocketConsumer):
                 message = 'Source file download link is not valid.'
                 messages.append(add_message(message, SocketMessage.error))
                 self.log.debug(f'{message} >> {dbx_download_link}')
-                return self.send(text_data=get_json_messages(messages))
+                return [get_json_messages(messages)]
+
+            try:
+                link_status = await get_link_status(dbx_download_link)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                link_status = err
 
-            request_data = requests.head(dbx_download_link)
-            if request_data.status_code != 200:
+            if link_status != 200:
                 message = 'Source file download link is expired.'
                 messages.append(add_message(message, SocketMessage.error))
-                self.log.debug(f'{message} >> {request_data.status_code}')
-                return self.send(text_data=get_json_messages(messages))
+                self.log.debug(f'{message} >> {link_status}')
+                return [get_json_messages(messages)]
+
+        return await database_sync_to_async(self.resubmit_job)(job, frame_list, messages)
 
+    def resubmit_job(self, job, frame_list, messages):
         initial = {'user': self.scope["user"],
                    'name': job.data.get('file_info').get('file_name'),
                    'frame_list': [frame_list, ],
                    'render_plan': job.render_plan,
                    'file_storage': job.file_storage,
                    'output_format': job.output_format,
-                   'status': JobStatus.objects.filter(name='submitted').first(),
+                   'status': statuses.get('submitted'),
                    'software_version': job.software_version,
                    'data': job.data
                    }
@@ -337,18 +353,19 @@ class JobsConsumer(WebsocketConsumer):
         message = f'New job submitted {new_job.name}.'
         messages.append(add_message(message, SocketMessage.success))
         self.log.debug(f'{message} >> {new_job}')
-        return self.send(text_data=get_json_messages(messages))
+        return [get_json_messages(messages)]
 
     def update_version_dependencies(self, data):
+        replies = []
         data = data['data']
         keyshot_form = KeyShotJobForm()
         software = Software.objects.filter(name=data['software'])
         if not software:
-            return
+            return replies
         software = software.first()
         version = software.softwareversion_set.filter(version=data['version'])
         if not version:
-            return
+            return replies
         version = version.first()
 
         # update render plan
@@ -356,21 +373,23 @@ class JobsConsumer(WebsocketConsumer):
         render_plan_field = keyshot_form.fields['render_plan'].widget.render("render_plan", '')
         data['action'] = 'update_render_plan'
         data['data'] = render_plan_field
-        self.send(text_data=json.dumps(data))
+        replies.append(json.dumps(data))
 
         # update output format
         keyshot_form.fields['output_format'].queryset = version.output_formats
         output_format_field = keyshot_form.fields['output_format'].widget.render("output_format", '')
         data['action'] = 'update_output_format'
         data['data'] = output_format_field
-        self.send(text_data=json.dumps(data))
+        replies.append(json.dumps(data))
 
         # update file_storage
         keyshot_form.fields['file_storage'].queryset = version.file_storages
         file_storage_field = keyshot_form.fields['file_storage'].widget.render("file_storage", '')
         data['action'] = 'update_storage'
         data['data'] = file_storage_field
-        self.send(text_data=json.dumps(data))
+        replies.append(json.dumps(data))
+
+        return replies
 
     def get_select_file_modal(self, data):
 
@@ -385,4 +404,4 @@ class JobsConsumer(WebsocketConsumer):
 
         html = render_to_string('job/select_file_modal.html', context={'user_files': reversed(user_files)})
         data = {'action': 'set_select_file_modal', 'html': html}
-        return self.send(text_data=json.dumps(data))
+        return [json.dumps(data)]
@@ -0,0 +1,120 @@
+import logging
+import threading
+from collections import deque
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+from job.models import JobError
+from rendershot_django.utils import bump_cache_version
+
+logger = logging.getLogger('JobAPI')
+
+CACHE_VERSION_KEY = 'job_error_matcher_version'
+
+
+class ErrorMatcher:
+    """
+    aho-corasick automaton over JobError patterns, finds every pattern contained
+    in a message with a single scan of the message.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [dict()]
+        self._fail = [0]
+        self._output = [[]]
+        self._pattern_count = 0
+
+        for key, pattern in patterns:
+            if pattern:
+                self._add_pattern(key, pattern)
+        self._build_failure_links()
+
+    def __len__(self):
+        return self._pattern_count
+
+    def _add_pattern(self, key, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append(dict())
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(key)
+        self._pattern_count += 1
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def match(self, message):
+        found = []
+        state = 0
+        for char in message or '':
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            for key in self._output[state]:
+                if key not in found:
+                    found.append(key)
+        return found
+
+
+_lock = threading.Lock()
+_matchers = dict()
+_matchers_version = None
+
+
+def build_error_matcher(software_id):
+    # errors without a software apply to every software
+    errors = JobError.objects.filter(Q(software_id=software_id) | Q(software__isnull=True))
+    return ErrorMatcher(errors.values_list('id', 'error'))
+
+
+def get_error_matcher(software_id=None):
+    """
+    return the cached matcher of a software, rebuilt only after a JobError changed
+    in this or any other process.
+    """
+    global _matchers_version
+
+    version = cache.get(CACHE_VERSION_KEY, 0)
+    with _lock:
+        if version != _matchers_version:
+            _matchers.clear()
+            _matchers_version = version
+
+        matcher = _matchers.get(software_id)
+        if matcher is None:
+            matcher = build_error_matcher(software_id)
+            _matchers[software_id] = matcher
+            logger.debug(f"job error matcher built : {software_id} >> {len(matcher)} patterns")
+
+    return matcher
+
+
+def invalidate_error_matchers(*args, **kwargs):
+    with _lock:
+        _matchers.clear()
+
+    bump_cache_version(CACHE_VERSION_KEY)
+
+
+post_save.connect(invalidate_error_matchers, sender=JobError)
+post_delete.connect(invalidate_error_matchers, sender=JobError)
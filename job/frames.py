@@ -0,0 +1,69 @@
+import re
+
+# one chunk of a frame range spec : "150", "1-100", "1-100:2" or "1-100x2"
+FRAME_RANGE_PATTERN = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+)\s*(?:[:x]\s*(\d+)\s*)?)?$')
+FRAME_NUMBER_PATTERN = re.compile(r'-?\d+')
+
+
+def parse_frame_ranges(spec):
+    """
+    parse a frame range spec like "1-100:2,150" into (first, last, step) tuples.
+    spec can be a string or a list of strings, like Job.frame_list. raises ValueError
+    for a chunk that is not a frame range.
+    """
+    chunks = spec.split(',') if isinstance(spec, str) else [chunk for item in spec for chunk in item.split(',')]
+
+    ranges = []
+    for chunk in chunks:
+        result = FRAME_RANGE_PATTERN.match(chunk)
+        if not result:
+            raise ValueError(f"invalid frame range : {chunk}")
+
+        first, last, step = result.groups()
+        first = int(first)
+        last = int(last) if last else first
+        step = int(step) if step else 1
+        if not step:
+            raise ValueError(f"invalid frame range step : {chunk}")
+
+        ranges.append((first, last, step))
+    return ranges
+
+
+def parse_frame_numbers(frame_list):
+    """ frame numbers of a deadline task frame list like "[1, 2, 3]", without evaluating it """
+    return [int(frame) for frame in FRAME_NUMBER_PATTERN.findall(frame_list or '')]
+
+
+def count_frame_numbers(frame_list):
+    return len(FRAME_NUMBER_PATTERN.findall(frame_list or ''))
+
+
+def compact_frames(frames):
+    """ compact ordered frame numbers into (first, last, step) tuples of consecutive frames """
+    ranges = []
+    first = last = None
+    for frame in frames:
+        if last is not None and frame == last + 1:
+            last = frame
+            continue
+
+        if first is not None:
+            ranges.append((first, last, 1))
+        first = last = frame
+
+    if first is not None:
+        ranges.append((first, last, 1))
+    return ranges
+
+
+def format_frame_ranges(ranges):
+    chunks = []
+    for first, last, step in ranges:
+        if first == last:
+            chunks.append(str(first))
+        elif step == 1:
+            chunks.append(f"{first}-{last}")
+        else:
+            chunks.append(f"{first}-{last}:{step}")
+    return ",".join(chunks)
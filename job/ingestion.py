@@ -0,0 +1,87 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from job.models import JobTask
+from job.frames import count_frame_numbers
+
+logger = logging.getLogger('JobAPI')
+
+# exception handling for bad render time data from deadline
+MAX_TASK_RENDER_TIME = 2000
+
+TASK_UPDATE_FIELDS = ['cost', 'cpu_usage', 'frame_list', 'frame_count', 'render_time', 'render_time_string',
+                      'date_modified']
+
+
+def parse_task_reports(job, new_tasks):
+    """
+    turn a deadline tasks report into JobTask field values keyed by deadline task id,
+    computing every task cost in one pass. returns the values and the reported total cost.
+    """
+    rate_per_min = job.render_plan.rate_per_min
+    reports = dict()
+    total_cost = float()
+
+    for task_id, task_data in new_tasks.items():
+        new_render_time = float(task_data.get('render_time'))
+        if new_render_time > MAX_TASK_RENDER_TIME:
+            logger.debug(f"bad deadline render time report : {job.name} >> {new_render_time}")
+            continue
+
+        new_cost = new_render_time * rate_per_min
+        total_cost += new_cost
+
+        reports[int(task_id)] = {'cost': new_cost,
+                                 'cpu_usage': task_data.get('cpu_usage'),
+                                 'frame_list': task_data.get('frame_list'),
+                                 'frame_count': count_frame_numbers(task_data.get('frame_list')),
+                                 'render_time': new_render_time,
+                                 'render_time_string': task_data.get('render_time_string')}
+
+    return reports, total_cost
+
+
+def ingest_task_reports(job, new_tasks, batch_size=500):
+    """
+    write a deadline tasks report with one select for the existing tasks of the job,
+    one bulk update and one bulk insert, no matter how many tasks are reported.
+    job.frame_count is moved by the reported frames in the database, saving the job is left to the caller.
+    """
+    reports, total_cost = parse_task_reports(job, new_tasks)
+    if not reports:
+        return total_cost
+
+    # keep the lowest id per deadline task, like the previous .first() lookup did
+    exist_tasks = dict()
+    for task in job.jobtask_set.filter(deadline_task_id__in=reports.keys()).order_by('-id'):
+        exist_tasks[task.deadline_task_id] = task
+
+    now = timezone.now()
+    update_tasks = []
+    create_tasks = []
+    frame_count_delta = 0
+    for task_id, values in reports.items():
+        exist_task = exist_tasks.get(task_id)
+        frame_count_delta += values['frame_count']
+        if exist_task:
+            frame_count_delta -= exist_task.frame_count or 0
+            for field, value in values.items():
+                setattr(exist_task, field, value)
+            exist_task.date_modified = now
+            update_tasks.append(exist_task)
+        else:
+            create_tasks.append(JobTask(job=job, deadline_task_id=task_id, **values))
+
+    with transaction.atomic():
+        if update_tasks:
+            JobTask.objects.bulk_update(update_tasks, TASK_UPDATE_FIELDS, batch_size=batch_size)
+        if create_tasks:
+            JobTask.objects.bulk_create(create_tasks, batch_size=batch_size)
+
+    if frame_count_delta:
+        job.update_counters(frame_count=frame_count_delta)
+
+    logger.debug(f"tasks ingested : {job.name} >> {len(update_tasks)} updated, {len(create_tasks)} created")
+    return total_cost
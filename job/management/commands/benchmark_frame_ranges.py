@@ -0,0 +1,60 @@
+import timeit
+import itertools
+
+from django.core.management.base import BaseCommand
+
+from job import frames
+from job import utils as job_utils
+
+
+def list_to_range_eval(sequence):
+    """ previous job.utils.list_to_range behaviour, eval and itertools.groupby """
+    sequence = eval(sequence)
+
+    def make_ranges(sequence_list):
+        for a, b in itertools.groupby(enumerate(sequence_list), lambda pair: pair[1] - pair[0]):
+            b = list(b)
+            yield b[0][1], b[-1][1]
+
+    result = list(make_ranges(sequence))
+    ranges = []
+    for first, last in result:
+        ranges.append(str(first) if first == last else f"{first}-{last}")
+    return ",".join(ranges)
+
+
+def frames_count_eval(frame_list):
+    """ previous Job.frames_count behaviour for one task """
+    return len(eval(frame_list))
+
+
+def build_frame_list(size, gap_every):
+    # drop one frame every gap_every frames so the list compacts into several ranges
+    return str([frame for frame in range(1, size + 1) if not gap_every or frame % gap_every])
+
+
+class Command(BaseCommand):
+    help = 'Compare the eval based frame list display and count with the frame range parser.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--gap-every', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        cases = {'display': {'eval': list_to_range_eval, 'parser': job_utils.list_to_range},
+                 'count': {'eval': frames_count_eval, 'parser': frames.count_frame_numbers}}
+
+        self.stdout.write(f"{'frames':>7} {'case':>8} {'mode':>7} {'ms/call':>10} {'speedup':>8}")
+        for size in options['sizes']:
+            frame_list = build_frame_list(size, options['gap_every'])
+            for case, modes in cases.items():
+                results = {mode: function(frame_list) for mode, function in modes.items()}
+                if len(set(results.values())) != 1:
+                    self.stderr.write(f"{case} results differ for {size} frames : {results}")
+
+                timings = {mode: min(timeit.repeat(lambda: function(frame_list), number=1, repeat=options['repeat']))
+                           for mode, function in modes.items()}
+                for mode, elapsed in timings.items():
+                    speedup = timings['eval'] / elapsed if elapsed else float()
+                    self.stdout.write(f"{size:>7} {case:>8} {mode:>7} {elapsed * 1000:>10.3f} {speedup:>7.1f}x")
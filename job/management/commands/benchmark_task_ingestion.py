@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from job.models import Job, JobTask
+from job.ingestion import ingest_task_reports, parse_task_reports
+
+
+def ingest_task_reports_per_task(job, new_tasks):
+    """ previous JobAPI.put behaviour, one lookup and one write per reported task """
+    reports, total_cost = parse_task_reports(job, new_tasks)
+    for task_id, values in reports.items():
+        exist_task = job.jobtask_set.filter(deadline_task_id=task_id).first()
+        if exist_task:
+            for field, value in values.items():
+                setattr(exist_task, field, value)
+            exist_task.save()
+        else:
+            JobTask.objects.create(job=job, deadline_task_id=task_id, **values)
+    return total_cost
+
+
+def build_report(size):
+    return {str(task_id): {'cpu_usage': 87.5,
+                           'frame_list': str([task_id]),
+                           'render_time': 1.5,
+                           'render_time_string': '00:01:30'}
+            for task_id in range(size)}
+
+
+class Command(BaseCommand):
+    help = 'Compare database round trips and latency of per-task and batched task report ingestion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_name', help='Existing job to ingest the reports into, all writes are rolled back.')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 2000])
+
+    def handle(self, *args, **options):
+        job = Job.objects.filter(name=options['job_name']).select_related('render_plan').first()
+        if not job:
+            raise CommandError(f"job {options['job_name']} could not be found.")
+
+        ingestors = {'per_task': ingest_task_reports_per_task,
+                     'batched': ingest_task_reports}
+
+        self.stdout.write(f"{'size':>6} {'mode':>10} {'phase':>8} {'queries':>8} {'ms':>10}")
+        for size in options['sizes']:
+            report = build_report(size)
+            for mode, ingestor in ingestors.items():
+                with transaction.atomic():
+                    job.jobtask_set.all().delete()
+                    # first pass inserts every task, second pass updates them
+                    for phase in ['insert', 'update']:
+                        queries, elapsed = self.measure(ingestor, job, report)
+                        self.stdout.write(f"{size:>6} {mode:>10} {phase:>8} {queries:>8} {elapsed * 1000:>10.1f}")
+                    transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(ingestor, job, report):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            ingestor(job, report)
+            elapsed = time.perf_counter() - start
+        return len(context.captured_queries), elapsed
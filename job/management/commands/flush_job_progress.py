@@ -0,0 +1,29 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+
+from job import progress as job_progress
+
+logger = logging.getLogger('JobAPI')
+
+
+class Command(BaseCommand):
+    help = 'Write buffered farm progress updates of running jobs to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=job_progress.FLUSH_INTERVAL,
+                            help='Seconds between two flushes.')
+        parser.add_argument('--once', action='store_true',
+                            help='Flush the currently buffered jobs and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = job_progress.flush_pending()
+            if flushed:
+                logger.debug(f"{flushed} buffered jobs written")
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+# Generated by Django 3.1 on 2026-10-18 13:05
+
+import ast
+
+from django.db import migrations, models
+
+
+def count_frames(apps, schema_editor):
+    Job = apps.get_model('job', 'Job')
+    JobTask = apps.get_model('job', 'JobTask')
+
+    frame_counts = dict()
+    for job_id, frame_list in JobTask.objects.values_list('job_id', 'frame_list').iterator():
+        try:
+            frames = len(ast.literal_eval(frame_list or '[]'))
+        except (ValueError, SyntaxError, TypeError):
+            frames = 0
+        frame_counts[job_id] = frame_counts.get(job_id, 0) + frames
+
+    jobs = list(Job.objects.filter(pk__in=frame_counts.keys()).only('pk'))
+    for job in jobs:
+        job.frame_count = frame_counts[job.pk]
+    Job.objects.bulk_update(jobs, ['frame_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0016_submitsession_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='frame_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.RunPython(count_frames, migrations.RunPython.noop),
+    ]
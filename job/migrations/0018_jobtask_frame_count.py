@@ -0,0 +1,38 @@
+# Generated by Django 3.1 on 2026-10-18 13:40
+
+import re
+
+from django.db import migrations, models
+
+FRAME_NUMBER_PATTERN = re.compile(r'-?\d+')
+
+
+def count_task_frames(apps, schema_editor):
+    JobTask = apps.get_model('job', 'JobTask')
+
+    tasks = []
+    for task in JobTask.objects.only('pk', 'frame_list').iterator():
+        task.frame_count = len(FRAME_NUMBER_PATTERN.findall(task.frame_list or ''))
+        tasks.append(task)
+
+        if len(tasks) >= 500:
+            JobTask.objects.bulk_update(tasks, ['frame_count'])
+            tasks = []
+
+    JobTask.objects.bulk_update(tasks, ['frame_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0017_job_frame_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobtask',
+            name='frame_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.RunPython(count_task_frames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('job', '0019_auto_20261018_1410'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='name',
+            field=models.CharField(blank=True, db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['user', 'status'], name='job_job_user_id_4126db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobtask',
+            index=models.Index(fields=['job', 'deadline_task_id'], name='job_jobtask_job_id_96ef23_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0020_auto_20261018_1450'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
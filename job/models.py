@@ -4,11 +4,13 @@ import uuid
 
 from django.urls import reverse
 from django.template.loader import render_to_string
-from django.forms.models import model_to_dict
-from django.db import models
-from django.db.models.signals import post_save, pre_delete, pre_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, pre_delete, pre_save, post_delete
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from channels.layers import get_channel_layer
@@ -16,8 +18,7 @@ from asgiref.sync import async_to_sync
 
 from job import utils as job_utils
 from payment.models import *
-from system.models import SocketConnection
-from rendershot_django.utils import post_message_to_slack
+from system import outbox, presence
 
 
 channel_layer = get_channel_layer()
@@ -168,9 +169,17 @@ class JobError(models.Model):
         return self.error
 
 
+class JobRevisionConflict(Exception):
+
+    def __init__(self, job, revision):
+        self.job = job
+        self.revision = revision
+        super(JobRevisionConflict, self).__init__(f"job {job} was saved by another writer since revision {revision}")
+
+
 class Job(models.Model):
     user = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
-    name = models.CharField(max_length=200, null=True, blank=True)
+    name = models.CharField(max_length=200, null=True, blank=True, db_index=True)
     frame_list = ArrayField(models.CharField(max_length=50, blank=True, null=True))
     render_plan = models.ForeignKey(RenderPlan, null=True, blank=True, on_delete=models.RESTRICT)
     file_storage = models.ForeignKey(FileStorage, null=True, blank=True, on_delete=models.RESTRICT)
@@ -184,8 +193,20 @@ class Job(models.Model):
     date_modified = models.DateTimeField(auto_now=True)
     deadline_tasks_count = models.IntegerField(default=0, null=True)
     cost = models.FloatField(default=0.0, null=True, blank=True)
+    frame_count = models.IntegerField(default=0, null=True)
+    revision = models.PositiveIntegerField(default=0)
     error = models.ManyToManyField(JobError, blank=True)
 
+    tracked_fields = ['status_id', 'render_plan_id', 'cost', 'revision']
+
+    # attempts of save_changes when other writers keep saving the job first
+    save_attempts = 5
+
+    class Meta:
+        # keyset paginated job list and per status job lookups of a user
+        indexes = [models.Index(fields=['user', '-date_created', '-id']),
+                   models.Index(fields=['user', 'status'])]
+
     def __init__(self, *args, **kwargs):
         self.operator = 'web_admin'
         self.status_signals = {'on_suspended': self.on_suspended,
@@ -202,40 +223,135 @@ class Job(models.Model):
                              }
 
         super(Job, self).__init__(*args, **kwargs)
+        self._loaded_state = self._get_tracked_state()
 
     def __str__(self):
         return self.name
 
+    def _get_tracked_state(self):
+        # read from __dict__ so deferred fields are not loaded just for tracking
+        return {field: self.__dict__.get(field, models.DEFERRED) for field in self.tracked_fields}
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(Job, self).refresh_from_db(*args, **kwargs)
+        self._loaded_state = self._get_tracked_state()
+
     def save(self, *args, **kwargs):
-        pre_save_model = Job.objects.filter(pk=self.pk).first()
+        is_new = self._state.adding
+        pre_save_state = self._loaded_state
 
         if 'operator' in kwargs:
             self.operator = kwargs.pop('operator')
 
-        super(Job, self).save(*args, **kwargs)
-
-        call_status_signals = False
-        call_plan_signals = False
-
-        if not pre_save_model and self.status.name == 'submitted':
-            call_status_signals = True
-            self.user_socket_job_update('add_job')
-        else:
-            self.user_socket_job_update('update_job')
-
-        if pre_save_model and pre_save_model.status.name != self.status.name:
-            call_status_signals = True
-
-        if call_status_signals:
-            status_signal = self.status_signals.get(f'on_{self.status.name}', None)
-            status_signal and status_signal()
+        pre_save_cost = float() if is_new else pre_save_state['cost']
+
+        # compare and swap, the row is only written when nobody saved it since it was loaded
+        self._expected_revision = None
+        if not is_new and pre_save_state['revision'] is not models.DEFERRED:
+            self._expected_revision = pre_save_state['revision']
+            self.revision = self._expected_revision + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'revision'}
+
+        # notifications are queued in the outbox inside the same transaction as the change
+        with transaction.atomic():
+            super(Job, self).save(*args, **kwargs)
+            spent = float() if pre_save_cost is models.DEFERRED else (self.cost or float()) - (pre_save_cost or float())
+            if spent:
+                BalanceLedger.add_spent(self.user_id, spent)
+
+            # status signals may save the job again, so the new state has to be tracked first
+            self._loaded_state = self._get_tracked_state()
+
+            call_status_signals = False
+            call_plan_signals = False
+
+            if not is_new and pre_save_state['status_id'] != self.status_id:
+                call_status_signals = True
+
+            if not is_new and pre_save_state['render_plan_id'] != self.render_plan_id:
+                call_plan_signals = True
+
+            if is_new and self.status.name == 'submitted':
+                call_status_signals = True
+                self.user_socket_job_update('add_job')
+            elif is_new or call_status_signals or call_plan_signals:
+                self.user_socket_job_update('update_job')
+            else:
+                # progress and cost reports only need a delta, the row keeps its layout
+                self.user_socket_job_update('patch_job')
+
+            if call_status_signals:
+                status_signal = self.status_signals.get(f'on_{self.status.name}', None)
+                status_signal and status_signal()
+
+            if call_plan_signals:
+                plan_signal = self.plan_signals.get('on_plan_changed', None)
+                plan_signal and plan_signal()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_revision = getattr(self, '_expected_revision', None)
+        if expected_revision is None:
+            return super(Job, self)._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        updated = super(Job, self)._do_update(base_qs.filter(revision=expected_revision), using, pk_val, values,
+                                              update_fields, forced_update)
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            self.revision = expected_revision
+            raise JobRevisionConflict(self, expected_revision)
+        return updated
+
+    def save_changes(self, apply_changes, **kwargs):
+        """
+        apply_changes(job) then save, when another writer saved the job in between, the
+        job is reloaded and the changes applied again on top of the stored row. guards
+        belong in apply_changes, it returns False to leave the reloaded job unsaved.
+        returns whether the job was saved.
+        """
+        for attempt in range(1, self.save_attempts + 1):
+            if apply_changes(self) is False:
+                return False
+            try:
+                self.save(**kwargs)
+                return True
+            except JobRevisionConflict:
+                if attempt == self.save_attempts:
+                    raise
+                self.refresh_from_db()
+
+    def update_counters(self, reset=False, **values):
+        """
+        add values to the counter fields with one F expression update, or set them when
+        reset, the spent balance follows the cost change. the instance gets the stored
+        counters, and the new revision only when no other writer changed the job since it
+        was loaded, so unsaved changes still go through the revision check.
+        """
+        queryset = Job.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            if reset:
+                pre_update_cost = queryset.select_for_update().values_list('cost', flat=True).first()
+                spent = values['cost'] - (pre_update_cost or float()) if 'cost' in values else float()
+                changes = values
+            else:
+                spent = values.get('cost', float())
+                changes = {field: Coalesce(F(field), models.Value(0), output_field=self._meta.get_field(field)) + value
+                           for field, value in values.items()}
+
+            queryset.update(revision=F('revision') + 1, date_modified=timezone.now(), **changes)
+            BalanceLedger.add_spent(self.user_id, spent)
+            stored = queryset.values('revision', *values).first()
+
+        if not stored:
+            return
 
-        if pre_save_model and pre_save_model.render_plan.name != self.render_plan.name:
-            call_plan_signals = True
+        for field in values:
+            setattr(self, field, stored[field])
+            if field in self._loaded_state:
+                self._loaded_state[field] = stored[field]
 
-        if call_plan_signals:
-            plan_signal = self.plan_signals.get('on_plan_changed', None)
-            plan_signal and plan_signal()
+        if self._loaded_state['revision'] is not models.DEFERRED and \
+                stored['revision'] == self._loaded_state['revision'] + 1:
+            self.revision = self._loaded_state['revision'] = stored['revision']
 
     @property
     def user_profile(self):
@@ -258,18 +374,24 @@ class Job(models.Model):
             job_data['system_info']['storage_type'] = instance.file_storage.name
         instance.data = job_data
 
+    @classmethod
+    def post_delete(cls, sender, instance, **kwargs):
+        # the user ledger is already gone when jobs are deleted along with their user
+        BalanceLedger.add_spent(instance.user_id, -(instance.cost or float()), seed_missing=False)
+
     @property
     def frames_count(self):
-        tasks = self.jobtask_set.all()
-        frames = 0
-        for task in tasks:
-            frames += len(eval(task.frame_list))
-
-        return frames
+        return self.frame_count or 0
 
     def count_by_status(self, status):
         return len(self.objects.filter(status=status))
 
+    @classmethod
+    def status_counts(cls, user):
+        """ job count of every status of a user, keyed by status id, in a single grouped query """
+        counts = cls.objects.filter(user=user).order_by().values('status_id').annotate(count=models.Count('id'))
+        return {row['status_id']: row['count'] for row in counts}
+
     @property
     def count_rendering(self):
         return len(self.objects.filter(status=JobStatus.objects.filter(name='rendering').first()))
@@ -401,6 +523,7 @@ class Job(models.Model):
     def on_completed(self):
         self.email_job_update()
         self.slack_job_update(self.on_completed.__name__)
+        outbox.enqueue_share_link(self.on_completed.__name__, self)
 
     def on_failed(self):
         # reset job cost on failed
@@ -448,25 +571,14 @@ class Job(models.Model):
 
     def email_job_update(self):
         if self.user.profile.receive_job_email_notifs:
-            from django.contrib.sites.models import Site
-            current_site = Site.objects.get_current()
-            site_name = current_site.name
-            domain = current_site.domain
-
             context = {'subject': f'Job Update : {self.name}',
                        'description': f'New Update on {self.name}',
                        'paragraph_01': f'Your job {self.name} is {self.status.display_name}.',
                        'action_text': f'Job List',
-                       'action_url': reverse("job_list"),
-                       'current_site': current_site,
-                       'domain': domain, 'site_name': site_name,
-                       'protocol': 'https', }
-
-            html = render_to_string('email/job_update_email.html',
-                                    context=context)
+                       'action_url': reverse("job_list"), }
 
-            self.user.email_user(f'Update {self.name} is {self.status.display_name}',
-                                 self.name, html_message=html)
+            outbox.enqueue_email(f'on_{self.status.name}', self.user, context,
+                                 f'Update {self.name} is {self.status.display_name}', self.name)
 
     def slack_job_update(self, event):
 
@@ -490,60 +602,55 @@ class Job(models.Model):
                          'software': self.software_version.software.name,
                          'software_version': self.software_version.version})
 
-        post_message_to_slack(event, event, data)
+        outbox.enqueue_slack(event, event, event, data, user=self.user)
+
+    def get_socket_delta(self):
+        return {'status': self.status.name,
+                'status_display_name': self.status.display_name,
+                'status_description': self.status.description,
+                'progress': self.progress,
+                'cost': self.cost}
 
     def user_socket_job_update(self, event):
-        socket_conn = SocketConnection.objects.filter(user=self.user, group='jobs')
-        html = render_to_string('job/widgets/job_item.html', context={'job': self})
-        data = {'type': 'send_message', 'action': event, 'job_id': self.id, 'html': html}
-        for conn in socket_conn:
-            async_to_sync(channel_layer.send)(conn.channel, data)
+        # sent once the change is committed, a rolled back save never reaches the job list
+        transaction.on_commit(lambda: self.send_socket_job_update(event))
 
-    def admin_socket_job_update(self, event):
-        # remap job data to human readable values
+    def send_socket_job_update(self, event):
+        if not presence.is_listening('jobs', self.user_id):
+            return
 
-        if self.data.get('session_id'):
-            job_data = self.data
-
-            # add extra job data from related models
-            job_data['name'] = self.name
-            job_data['user'] = self.user.username
-            job_data['software_version'] = self.software_version.version
-            job_data['group'] = self.software_version.deadline_group
-            job_data['chunk_size'] = self.user.profile.chunk_size_override
-            job_data['render_plan'] = self.render_plan.name
-            job_data['machine_limit'] = self.render_plan.deadline_machine_limit
-            job_data['priority'] = self.render_plan.deadline_priority
-            job_data['deadline_id'] = self.deadline_id
-            job_data['frame_list'] = self.frame_list
+        data = {'type': 'send_message', 'action': event, 'job_id': self.id}
+        if event == 'patch_job':
+            data['data'] = self.get_socket_delta()
+        elif event != 'delete_job':
+            # rendered once and shared by every open tab of the user
+            data['html'] = render_to_string('job/widgets/job_item.html', context={'job': self})
 
-        else:
-            job_data = model_to_dict(self)
-            job_data['user'] = self.user.username
-            job_data['status'] = self.status.name
-            job_data['software_version'] = self.software_version.version
-            job_data['render_plan'] = self.render_plan.name
-            job_data['deadline_machine_limit'] = self.render_plan.deadline_machine_limit
-            job_data['deadline_priority'] = self.render_plan.deadline_priority
-            job_data['output_format'] = self.output_format.extension
-            job_data['file_storage'] = self.file_storage.name
+        async_to_sync(channel_layer.group_send)(presence.user_group('jobs', self.user_id), data)
+
+    def admin_socket_job_update(self, event):
+        from job.projections import get_admin_payload, get_admin_event_profile
+
+        job_data = get_admin_payload(self, get_admin_event_profile(event))
 
         # send to local farm and admin clients
-        async_to_sync(channel_layer.group_send)('admin', {'type': 'send_message', 'action': event, 'data': job_data})
+        outbox.enqueue_group_send(event, 'admin', {'type': 'send_message', 'action': event, 'data': job_data},
+                                  user=self.user)
 
         if self.data.get('session_data') and self.data.get('session_data').get('file_data'):
             return
 
         if self.data.get('session_id') and event == 'on_job_v2_submitted':
-            socket_conn = SocketConnection.objects.filter(user=self.user, group='client')
             data = {'type': 'send_message', 'event': 'job_session_submitted',
                     'data': {'username': self.user.username, 'session_id': self.data['session_id'],
                              'job_name': self.name, 'file_path': self.data.get('session_data').get('package_path')}}
 
-            for conn in socket_conn:
-                async_to_sync(channel_layer.send)(conn.channel, data)
+            if presence.is_listening('client', self.user_id):
+                outbox.enqueue_group_send(data['event'], presence.user_group('client', self.user_id), data,
+                                          user=self.user)
 
-            post_message_to_slack('on_job_session_submitted', 'job_session_submitted', data.get('data'))
+            outbox.enqueue_slack('on_job_session_submitted', 'on_job_session_submitted', 'job_session_submitted',
+                                 data.get('data'), user=self.user)
 
     def resubmit(self):
         if self.data.get('session_id'):
@@ -574,6 +681,7 @@ class Job(models.Model):
 
 
 pre_save.connect(Job.pre_save, sender=Job)
+post_delete.connect(Job.post_delete, sender=Job)
 
 
 class JobTask(models.Model):
@@ -583,10 +691,14 @@ class JobTask(models.Model):
     date_modified = models.DateTimeField(auto_now=True)
     cpu_usage = models.FloatField(default=0.0, null=True, blank=True)
     frame_list = models.CharField(max_length=3000, null=True, blank=True)
+    frame_count = models.IntegerField(default=0, null=True)
     render_time = models.FloatField(default=0.0, null=True, blank=True)
     render_time_string = models.CharField(max_length=200, null=True, blank=True)
     deadline_task_id = models.IntegerField(default=0, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['job', 'deadline_task_id'])]
+
     def __str__(self):
         return f"Task {self.id}"
 
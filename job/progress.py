@@ -0,0 +1,162 @@
+import json
+import time
+import logging
+import threading
+
+import redis
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from job.models import Job
+from system import presence
+
+logger = logging.getLogger('JobAPI')
+
+# a running job is written at most once per interval, heartbeats in between only reach the sockets
+FLUSH_INTERVAL = getattr(settings, 'JOB_PROGRESS_FLUSH_INTERVAL', 15)
+BUFFER_BACKEND = getattr(settings, 'JOB_PROGRESS_BUFFER', 'redis')
+
+# farm heartbeats that only report these fields are buffered instead of saved
+BUFFERED_FIELDS = ['progress', 'deadline_id']
+
+PENDING_KEY = 'job_progress:pending'
+
+
+class RedisProgressBuffer:
+    """ pending job fields in one redis hash per job, shared by every web process """
+    key_ttl = 24 * 60 * 60
+
+    def get_key(self, job_id):
+        return f'job_progress:{job_id}'
+
+    def add(self, job_id, fields):
+        pipe = presence.get_redis().pipeline()
+        pipe.hset(self.get_key(job_id), mapping={name: json.dumps(value) for name, value in fields.items()})
+        pipe.expire(self.get_key(job_id), self.key_ttl)
+        pipe.sadd(PENDING_KEY, job_id)
+        pipe.execute()
+
+    def claim_flush(self, job_id, interval):
+        return bool(presence.get_redis().set(f'job_progress_flush:{job_id}', 1, nx=True, ex=interval))
+
+    def pop(self, job_id):
+        pipe = presence.get_redis().pipeline()
+        pipe.hgetall(self.get_key(job_id))
+        pipe.delete(self.get_key(job_id))
+        pipe.srem(PENDING_KEY, job_id)
+        fields = pipe.execute()[0]
+        return {name.decode(): json.loads(value) for name, value in fields.items()}
+
+    def pending_ids(self):
+        return [int(job_id) for job_id in presence.get_redis().smembers(PENDING_KEY)]
+
+
+class MemoryProgressBuffer:
+    """ process local buffer with the same behaviour, for tests and single process setups """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fields = dict()
+        self._flushed = dict()
+
+    def add(self, job_id, fields):
+        with self._lock:
+            self._fields.setdefault(job_id, dict()).update(fields)
+
+    def claim_flush(self, job_id, interval):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._flushed.get(job_id, -interval) < interval:
+                return False
+            self._flushed[job_id] = now
+            return True
+
+    def pop(self, job_id):
+        with self._lock:
+            return self._fields.pop(job_id, dict())
+
+    def pending_ids(self):
+        with self._lock:
+            return list(self._fields)
+
+
+buffer_backends = {'redis': RedisProgressBuffer,
+                   'memory': MemoryProgressBuffer}
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+
+    if _buffer is None:
+        _buffer = buffer_backends[BUFFER_BACKEND]()
+    return _buffer
+
+
+def is_progress_only(job, data):
+    """ whether a farm job update only reports buffered fields, an unchanged task count or status is ignored """
+    fields = [name for name, value in data.items() if value and name != 'job_name']
+    if 'tasks_count' in fields and str(data['tasks_count']) == str(job.deadline_tasks_count):
+        fields.remove('tasks_count')
+    if 'status' in fields and data['status'] == job.status.name:
+        fields.remove('status')
+    return bool(fields) and all(name in BUFFERED_FIELDS for name in fields)
+
+
+def get_buffered_fields(data):
+    fields = dict()
+    if data.get('progress'):
+        fields['progress'] = float(data['progress'])
+    if data.get('deadline_id'):
+        fields['deadline_id'] = data['deadline_id']
+    return fields
+
+
+def write_fields(job_id, fields):
+    if fields:
+        Job.objects.filter(pk=job_id).update(revision=F('revision') + 1, date_modified=timezone.now(), **fields)
+
+
+def buffer_progress(job, data):
+    """
+    apply a progress only update to the job, push it to the user sockets at once and
+    keep it in the buffer, the row is written by the first heartbeat of every flush
+    interval, the next full save of the job, or flush_pending.
+    """
+    fields = get_buffered_fields(data)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+    job.user_socket_job_update('patch_job')
+
+    try:
+        job_buffer = get_buffer()
+        job_buffer.add(job.pk, fields)
+        if job_buffer.claim_flush(job.pk, FLUSH_INTERVAL):
+            write_fields(job.pk, job_buffer.pop(job.pk))
+    except redis.RedisError as err:
+        logger.error(f"job progress could not be buffered, writing it : {job.name} >> {err}")
+        write_fields(job.pk, fields)
+
+
+def pop_pending(job):
+    """ take the buffered fields of a job out of the buffer, for a save that writes them """
+    try:
+        return get_buffer().pop(job.pk)
+    except redis.RedisError as err:
+        logger.error(f"buffered job progress could not be read : {job.name} >> {err}")
+        return dict()
+
+
+def flush_pending():
+    """ write every buffered job, returns the number of jobs written """
+    job_buffer = get_buffer()
+    flushed = 0
+    for job_id in job_buffer.pending_ids():
+        fields = job_buffer.pop(job_id)
+        if fields:
+            write_fields(job_id, fields)
+            flushed += 1
+    return flushed
@@ -0,0 +1,160 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import prefetch_related_objects
+from django.forms.models import model_to_dict
+from django.urls import reverse
+
+from job.models import Job
+
+JOB_RELATIONS = ['user', 'status', 'software_version', 'render_plan', 'output_format', 'file_storage']
+
+# payload profiles : minimal for status updates, farm without the scene spec, full with everything
+PAYLOAD_PROFILES = ['minimal', 'farm', 'full']
+
+# the v2 scene dump, materials, environments, cameras and external files, fetched from the job spec endpoint
+SPEC_DATA_KEYS = ['session_data']
+
+REST_MINIMAL_FIELDS = ['id', 'name', 'user', 'status', 'progress', 'cost', 'frame_count', 'render_plan',
+                       'deadline_id', 'deadline_tasks_count', 'revision', 'date_modified']
+
+# profile of admin broadcasts per event, the farm needs more than the status only on submission
+ADMIN_PAYLOAD_PROFILE = getattr(settings, 'JOB_ADMIN_PAYLOAD_PROFILE', 'minimal')
+admin_event_profiles = {'on_submitted': 'farm',
+                        'on_job_v2_submitted': 'farm'}
+
+
+def select_job_relations(queryset):
+    """ load jobs with every reference row their payloads need, in one joined query """
+    return queryset.select_related(*JOB_RELATIONS, 'user__profile').prefetch_related('error')
+
+
+def get_missing_relations(job):
+    missing = [name for name in JOB_RELATIONS if not Job._meta.get_field(name).is_cached(job)]
+    if 'user' not in missing and job.user and not User._meta.get_field('profile').is_cached(job.user):
+        missing.append('user__profile')
+    return missing
+
+
+def attach_job_relations(job):
+    """
+    fill the reference rows an already loaded job is missing with one joined query,
+    relations already loaded, or changed and not saved yet, are left as they are.
+    """
+    if job.pk is None:
+        return job
+
+    missing = get_missing_relations(job)
+    if not missing:
+        return job
+
+    loaded = Job.objects.select_related(*JOB_RELATIONS, 'user__profile').filter(pk=job.pk).first()
+    if not loaded:
+        return job
+
+    for name in JOB_RELATIONS:
+        field = Job._meta.get_field(name)
+        if name in missing and getattr(loaded, field.attname) == getattr(job, field.attname):
+            field.set_cached_value(job, field.get_cached_value(loaded))
+
+    if 'user__profile' in missing and job.user_id == loaded.user_id:
+        profile_field = User._meta.get_field('profile')
+        profile_field.set_cached_value(job.user, profile_field.get_cached_value(loaded.user, default=None))
+
+    return job
+
+
+def attach_job_errors(job):
+    prefetch_related_objects([job], 'error')
+    return job
+
+
+def get_admin_event_profile(event):
+    if ADMIN_PAYLOAD_PROFILE == 'full':
+        return 'full'
+    return admin_event_profiles.get(event, ADMIN_PAYLOAD_PROFILE)
+
+
+def get_spec_url(job):
+    return f"{reverse('job_spec')}?{urlencode({'job_name': job.name})}"
+
+
+def get_slim_data(job_data):
+    return {key: value for key, value in job_data.items() if key not in SPEC_DATA_KEYS}
+
+
+def get_admin_payload(job, profile='full'):
+    """ job data sent to the local farm and admin clients, see PAYLOAD_PROFILES """
+    attach_job_relations(job)
+
+    if profile == 'minimal':
+        return {'id': job.id,
+                'name': job.name,
+                'user': job.user.username,
+                'status': job.status.name,
+                'progress': job.progress,
+                'cost': job.cost,
+                'render_plan': job.render_plan.name,
+                'deadline_machine_limit': job.render_plan.deadline_machine_limit,
+                'deadline_priority': job.render_plan.deadline_priority,
+                'deadline_id': job.deadline_id,
+                'revision': job.revision}
+
+    if job.data.get('session_id'):
+        # copied, so the extra fields never end up in the saved job data
+        job_data = dict(job.data)
+
+        # add extra job data from related models
+        job_data['name'] = job.name
+        job_data['user'] = job.user.username
+        job_data['software_version'] = job.software_version.version
+        job_data['group'] = job.software_version.deadline_group
+        job_data['chunk_size'] = job.user.profile.chunk_size_override
+        job_data['render_plan'] = job.render_plan.name
+        job_data['machine_limit'] = job.render_plan.deadline_machine_limit
+        job_data['priority'] = job.render_plan.deadline_priority
+        job_data['deadline_id'] = job.deadline_id
+        job_data['frame_list'] = job.frame_list
+
+    else:
+        job_data = model_to_dict(attach_job_errors(job))
+        job_data['user'] = job.user.username
+        job_data['status'] = job.status.name
+        job_data['software_version'] = job.software_version.version
+        job_data['render_plan'] = job.render_plan.name
+        job_data['deadline_machine_limit'] = job.render_plan.deadline_machine_limit
+        job_data['deadline_priority'] = job.render_plan.deadline_priority
+        job_data['output_format'] = job.output_format.extension
+        job_data['file_storage'] = job.file_storage.name
+        job_data['error'] = [error.pk for error in job_data.get('error', [])]
+
+    if profile == 'farm':
+        if job.data.get('session_id'):
+            job_data = get_slim_data(job_data)
+        else:
+            job_data['data'] = get_slim_data(job_data.get('data') or {})
+        job_data['spec_url'] = get_spec_url(job)
+
+    return job_data
+
+
+def get_rest_payload(job, data, profile='full'):
+    """ replace the reference ids of a serialized job with their names, and trim it to the profile """
+    attach_job_relations(job)
+
+    data['user'] = job.user.username
+    data['status'] = job.status.name
+    data['software_version'] = job.software_version.version
+    data['render_plan'] = job.render_plan.name
+    if job.output_format:
+        data['output_format'] = job.output_format.extension
+    if job.file_storage:
+        data['file_storage'] = job.file_storage.name
+
+    if profile == 'minimal':
+        data = {field: value for field, value in data.items() if field in REST_MINIMAL_FIELDS}
+    elif profile == 'farm':
+        data['data'] = get_slim_data(data.get('data') or {})
+        data['spec_url'] = get_spec_url(job)
+    return data
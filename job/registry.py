@@ -0,0 +1,89 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from job.models import JobStatus, RenderPlan, OutputFormat
+from rendershot_django.utils import bump_cache_version
+
+logger = logging.getLogger('JobAPI')
+
+# seconds a process trusts its copy before reading the shared version again
+VERSION_CHECK_INTERVAL = getattr(settings, 'JOB_REGISTRY_VERSION_CHECK_INTERVAL', 5)
+
+
+class ReferenceRegistry:
+    """
+    process local copy of a small reference table indexed by pk and by a key field,
+    reloaded only after a row changed in this or any other process. the shared version
+    is read at most once per VERSION_CHECK_INTERVAL, changes made in another process
+    show up within that interval. the returned instances are shared, callers must not
+    modify them.
+    """
+
+    def __init__(self, model, key_field='name'):
+        self.model = model
+        self.key_field = key_field
+        self.version_key = f'job_registry_version_{model._meta.model_name}'
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = None
+        self._by_pk = None
+        self._by_key = None
+
+    def _load(self):
+        with self._lock:
+            if self._by_pk is not None and time.monotonic() - self._checked < VERSION_CHECK_INTERVAL:
+                return self._by_pk, self._by_key
+
+        version = cache.get(self.version_key, 0)
+        with self._lock:
+            self._checked = time.monotonic()
+            if self._by_pk is None or version != self._version:
+                rows = list(self.model.objects.order_by('pk'))
+                by_key = dict()
+                for row in rows:
+                    # first row by pk wins, like filter(...).first() did
+                    by_key.setdefault(getattr(row, self.key_field), row)
+
+                self._by_pk = {row.pk: row for row in rows}
+                self._by_key = by_key
+                self._version = version
+                logger.debug(f"reference registry loaded : {self.model.__name__} >> {len(rows)} rows")
+
+            return self._by_pk, self._by_key
+
+    def get(self, key):
+        return self._load()[1].get(key)
+
+    def get_by_pk(self, pk):
+        try:
+            return self._load()[0].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def all(self):
+        return list(self._load()[0].values())
+
+    def filter(self, **attrs):
+        return [row for row in self.all() if all(getattr(row, attr) == value for attr, value in attrs.items())]
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self._by_pk = None
+            self._by_key = None
+
+        bump_cache_version(self.version_key)
+
+
+statuses = ReferenceRegistry(JobStatus)
+plans = ReferenceRegistry(RenderPlan)
+output_formats = ReferenceRegistry(OutputFormat, key_field='extension')
+
+for registry in [statuses, plans, output_formats]:
+    post_save.connect(registry.invalidate, sender=registry.model, weak=False)
+    post_delete.connect(registry.invalidate, sender=registry.model, weak=False)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from job.models import Job, SubmitSession
+from job.projections import attach_job_relations, get_rest_payload
 
 
 class JobSerializer(serializers.ModelSerializer):
@@ -7,17 +8,24 @@ class JobSerializer(serializers.ModelSerializer):
         model = Job
         fields = '__all__'
 
+    def __init__(self, *args, profile='full', **kwargs):
+        # one of job.projections.PAYLOAD_PROFILES
+        self.profile = profile
+        super(JobSerializer, self).__init__(*args, **kwargs)
+
     def to_representation(self, instance):
+        attach_job_relations(instance)
         data = super(JobSerializer, self).to_representation(instance)
-        data['user'] = instance.user.username
-        data['status'] = instance.status.name
-        data['software_version'] = instance.software_version.version
-        data['render_plan'] = instance.render_plan.name
-        if instance.output_format:
-            data['output_format'] = instance.output_format.extension
-        if instance.file_storage:
-            data['file_storage'] = instance.file_storage.name
-        return data
+        return get_rest_payload(instance, data, self.profile)
+
+
+class JobStatusSerializer(serializers.ModelSerializer):
+    """ slim job record for clients polling job status, without the job data """
+    status = serializers.SlugRelatedField(slug_field='name', read_only=True)
+
+    class Meta:
+        model = Job
+        fields = ['name', 'status', 'progress', 'cost', 'frame_count', 'revision', 'date_modified']
 
 
 class SubmitSessionSerializer(serializers.ModelSerializer):
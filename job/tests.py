@@ -0,0 +1,578 @@
+import time
+import json
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, SimpleTestCase, RequestFactory
+from django.contrib.auth.models import User
+
+from job.models import *
+from job import utils as job_utils
+from job import registry
+from job import frames
+from job.ingestion import ingest_task_reports
+from rendershot_django.pagination import KeysetPaginationMixin
+from job.projections import get_admin_payload, select_job_relations
+from job.serializers import JobSerializer
+from job.actions import apply_job_action
+from job import progress as job_progress
+from job.api_views import JobAPI, JobBatchAPI, JobStatusAPI, JobSpecAPI
+from rest_framework.test import APIRequestFactory, force_authenticate
+from system import presence
+
+
+class JobTestMixin:
+
+    def setUp(self):
+        self.socket_patcher = mock.patch.object(Job, 'user_socket_job_update')
+        self.socket_update = self.socket_patcher.start()
+        self.addCleanup(self.socket_patcher.stop)
+
+        self.user = User.objects.create_user('render_user', 'render_user@rendershot.com', 'render_password')
+        self.queued_status = JobStatus.objects.create(name='queued', display_name='Queued')
+        self.rendering_status = JobStatus.objects.create(name='rendering', display_name='Rendering')
+        self.render_plan = RenderPlan.objects.create(name='animation_slow', display_name='Slow', rate_per_min=0.1)
+        self.software = Software.objects.create(name='KeyShot')
+        self.software_version = SoftwareVersion.objects.create(software=self.software,
+                                                               version='10',
+                                                               plugin_name='RBKeyshot')
+        self.output_format = OutputFormat.objects.create(extension='png')
+        self.file_storage = FileStorage.objects.create(name='RenderShare', setting={})
+
+    def create_job(self, name='scene', status=None):
+        return Job.objects.create(user=self.user,
+                                  name=name,
+                                  frame_list=['1-10'],
+                                  render_plan=self.render_plan,
+                                  file_storage=self.file_storage,
+                                  output_format=self.output_format,
+                                  status=status or self.queued_status,
+                                  software_version=self.software_version,
+                                  data=job_utils.get_job_schema())
+
+    def get_job(self, job):
+        return Job.objects.select_related('user',
+                                          'status',
+                                          'render_plan',
+                                          'software_version',
+                                          'output_format',
+                                          'file_storage').get(pk=job.pk)
+
+
+class JobTestCase(JobTestMixin, TestCase):
+    pass
+
+
+class JobSaveTestCase(JobTestCase):
+
+    def test_status_change_save_query_count(self):
+        job = self.get_job(self.create_job())
+        job.status = self.rendering_status
+
+        # savepoint, update and savepoint release, no pre-save select of the old row
+        with self.assertNumQueries(3):
+            job.save(operator='api')
+
+    def test_status_change_calls_status_signal_once(self):
+        job = self.get_job(self.create_job())
+
+        with mock.patch.object(job, 'status_signals', {'on_rendering': mock.Mock()}):
+            job.status = self.rendering_status
+            job.save(operator='api')
+            job.save(operator='api')
+
+            job.status_signals['on_rendering'].assert_called_once()
+
+    def test_plan_change_calls_plan_signal(self):
+        job = self.get_job(self.create_job())
+        fast_plan = RenderPlan.objects.create(name='animation_fast', display_name='Fast', rate_per_min=0.2)
+
+        with mock.patch.object(job, 'plan_signals', {'on_plan_changed': mock.Mock()}):
+            job.render_plan = fast_plan
+            job.save(operator='web_user')
+
+            job.plan_signals['on_plan_changed'].assert_called_once()
+
+    def test_progress_save_sends_socket_delta(self):
+        job = self.get_job(self.create_job())
+        self.socket_update.reset_mock()
+
+        job.progress = 40
+        job.cost = 1.5
+        job.save(operator='api')
+        self.socket_update.assert_called_once_with('patch_job')
+
+        job.status = self.rendering_status
+        job.save(operator='api')
+        self.socket_update.assert_called_with('update_job')
+
+    def test_status_counts_single_query(self):
+        self.create_job('scene_a')
+        self.create_job('scene_b')
+        self.create_job('scene_c', status=self.rendering_status)
+
+        with self.assertNumQueries(1):
+            counts = Job.status_counts(self.user)
+        self.assertEqual(counts, {self.queued_status.pk: 2, self.rendering_status.pk: 1})
+
+
+class JobPayloadTestCase(JobTestCase):
+
+    def test_rest_payload_query_count(self):
+        job = Job.objects.get(pk=self.create_job().pk)
+
+        # one joined query for the reference rows and one for the errors
+        with self.assertNumQueries(2):
+            data = JobSerializer(job).data
+        self.assertEqual(data['status'], 'queued')
+        self.assertEqual(data['file_storage'], 'RenderShare')
+
+    def test_admin_payload_query_count(self):
+        job = Job.objects.get(pk=self.create_job().pk)
+
+        with self.assertNumQueries(2):
+            data = get_admin_payload(job)
+        self.assertEqual(data['user'], 'render_user')
+        self.assertEqual(data['render_plan'], 'animation_slow')
+
+    def test_loaded_relations_are_not_queried_again(self):
+        self.create_job()
+        job = select_job_relations(Job.objects.all()).get()
+
+        with self.assertNumQueries(0):
+            JobSerializer(job).data
+            get_admin_payload(job)
+
+    def test_payload_profiles_leave_out_scene_spec(self):
+        job = self.create_job()
+        job.data = {'session_id': 'session_1', 'session_data': {'materials': ['paint'] * 100}}
+        job.save()
+
+        farm_data = get_admin_payload(job, 'farm')
+        self.assertNotIn('session_data', farm_data)
+        self.assertIn(job.name, farm_data['spec_url'])
+        self.assertNotIn('data', get_admin_payload(job, 'minimal'))
+        self.assertNotIn('data', JobSerializer(job, profile='minimal').data)
+        self.assertNotIn('session_data', JobSerializer(job, profile='farm').data['data'])
+
+        request = APIRequestFactory().get('/api-job/job/spec/', {'job_name': job.name})
+        force_authenticate(request, user=self.user)
+        response = JobSpecAPI.as_view()(request)
+        self.assertEqual(response.data['session_data'], job.data['session_data'])
+        self.assertNotIn('name', self.get_job(job).data)
+
+
+class JobActionTestCase(JobTestCase):
+
+    def setUp(self):
+        super(JobActionTestCase, self).setUp()
+        self.queued_status.is_suspendable = True
+        self.queued_status.save()
+        self.suspending_status = JobStatus.objects.create(name='suspending', display_name='Suspending')
+
+        presence_patcher = mock.patch.object(presence, 'is_listening', return_value=False)
+        presence_patcher.start()
+        self.addCleanup(presence_patcher.stop)
+
+    def suspend_jobs(self, count):
+        jobs = [self.create_job(f'scene_{count}_{index}') for index in range(count)]
+        registry.statuses.get('suspending')
+
+        with CaptureQueriesContext(connection) as context:
+            result = apply_job_action(self.user, [job.name for job in jobs] + ['missing'], 'suspend')
+        return result, len(context.captured_queries)
+
+    def test_suspend_jobs(self):
+        result, _ = self.suspend_jobs(3)
+
+        self.assertEqual(len(result.changed), 3)
+        self.assertEqual(result.missing, ['missing'])
+        self.assertEqual(Job.objects.filter(status=self.suspending_status).count(), 3)
+
+        result = apply_job_action(self.user, [job.name for job in result.changed], 'suspend')
+        self.assertEqual(len(result.unchanged), 3)
+
+    def test_query_count_does_not_grow_with_jobs(self):
+        _, few_queries = self.suspend_jobs(2)
+        _, many_queries = self.suspend_jobs(20)
+
+        self.assertEqual(few_queries, many_queries)
+
+
+class ReferenceRegistryTestCase(JobTestCase):
+
+    def test_lookup_does_not_query(self):
+        registry.statuses.get('queued')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.statuses.get('rendering'), self.rendering_status)
+            self.assertEqual(registry.plans.get_by_pk(str(self.render_plan.pk)), self.render_plan)
+            self.assertIsNone(registry.statuses.get('completed'))
+
+    def test_version_is_read_once_per_interval(self):
+        registry.statuses.get('queued')
+
+        with mock.patch.object(registry, 'cache') as cache:
+            for _ in range(10):
+                registry.statuses.get('rendering')
+            self.assertFalse(cache.get.called)
+
+            with mock.patch.object(registry.time, 'monotonic', return_value=time.monotonic() + 60):
+                registry.statuses.get('rendering')
+            cache.get.assert_called_once_with(registry.statuses.version_key, 0)
+
+    def test_save_invalidates_registry(self):
+        registry.statuses.get('queued')
+        completed_status = JobStatus.objects.create(name='completed', display_name='Completed')
+
+        self.assertEqual(registry.statuses.get('completed'), completed_status)
+
+
+class ProgressBufferTestCase(JobTestCase):
+
+    def setUp(self):
+        super(ProgressBufferTestCase, self).setUp()
+        buffer_patcher = mock.patch.object(job_progress, '_buffer', job_progress.MemoryProgressBuffer())
+        buffer_patcher.start()
+        self.addCleanup(buffer_patcher.stop)
+
+        self.job = self.create_job(status=self.rendering_status)
+        self.socket_update.reset_mock()
+
+    def put(self, **data):
+        request = APIRequestFactory().put('/api-job/job/', dict(job_name=self.job.name, **data))
+        force_authenticate(request, user=self.user)
+        return JobAPI.as_view()(request)
+
+    def test_heartbeats_are_written_once_per_interval(self):
+        for progress in range(1, 11):
+            self.put(progress=progress, deadline_id='deadline_1')
+
+        self.assertEqual(self.get_job(self.job).progress, 1.0)
+        self.assertEqual(self.get_job(self.job).deadline_id, 'deadline_1')
+        self.assertEqual(self.socket_update.call_count, 10)
+        self.socket_update.assert_called_with('patch_job')
+
+        self.assertEqual(job_progress.flush_pending(), 1)
+        self.assertEqual(self.get_job(self.job).progress, 10.0)
+
+    def test_unchanged_status_is_buffered(self):
+        self.put(progress=1, status='rendering')
+        self.put(progress=20, status='rendering')
+
+        self.assertEqual(self.get_job(self.job).progress, 1.0)
+        self.assertEqual(job_progress.flush_pending(), 1)
+        self.assertEqual(self.get_job(self.job).progress, 20.0)
+
+    def test_status_change_writes_buffered_progress(self):
+        self.put(progress=1)
+        self.put(progress=50)
+        self.put(status='queued')
+
+        job = self.get_job(self.job)
+        self.assertEqual((job.status, job.progress), (self.queued_status, 50.0))
+        self.assertEqual(job_progress.flush_pending(), 0)
+
+
+class JobBatchAPITestCase(JobTestCase):
+
+    def test_batch_reports_suspend_for_negative_balance(self):
+        suspended_status = JobStatus.objects.create(name='suspended', display_name='Suspended')
+        self.create_job('scene_a', status=self.rendering_status)
+        self.create_job('scene_b', status=self.rendering_status)
+
+        reports = [{'job_name': 'scene_a', 'tasks_count': 2, 'tasks': {'1': {'render_time': 2, 'frame_list': '[1]'}}},
+                   {'job_name': 'scene_b', 'progress': 20},
+                   {'job_name': 'missing', 'progress': 5}]
+        request = APIRequestFactory().put('/api-job/jobs/', {'jobs': reports}, format='json')
+        force_authenticate(request, user=self.user)
+        response = JobBatchAPI.as_view()(request)
+
+        results = [(result['job_name'], result['result'], result['suspended']) for result in response.data['jobs']]
+        self.assertEqual(results, [('scene_a', 'updated', True),
+                                   ('scene_b', 'updated', True),
+                                   ('missing', 'missing', False)])
+        self.assertEqual(Job.objects.filter(status=suspended_status).count(), 2)
+        self.assertEqual(Job.objects.get(name='scene_b').progress, 20)
+
+    def test_failing_report_only_fails_its_job(self):
+        self.create_job('scene_a', status=self.rendering_status)
+        self.create_job('scene_b', status=self.rendering_status)
+        self.create_job('scene_c', status=self.rendering_status)
+
+        reports = [{'job_name': 'scene_a', 'tasks': {'1': {'render_time': 2, 'frame_list': '[1]'}}},
+                   'scene_b',
+                   {'job_name': 'scene_b', 'status': 'queued'},
+                   {'job_name': 'scene_c', 'status': 'queued'}]
+        request = APIRequestFactory().put('/api-job/jobs/', {'jobs': reports}, format='json')
+        force_authenticate(request, user=self.user)
+        save_changes = Job.save_changes
+
+        def save_or_conflict(job, *args, **kwargs):
+            if job.name == 'scene_c':
+                raise JobRevisionConflict(job, job.revision)
+            return save_changes(job, *args, **kwargs)
+
+        with mock.patch.object(Job, 'save_changes', autospec=True, side_effect=save_or_conflict):
+            response = JobBatchAPI.as_view()(request)
+
+        results = [(result['job_name'], result['result']) for result in response.data['jobs']]
+        self.assertEqual(results, [('scene_a', 'error'), (None, 'error'), ('scene_b', 'updated'),
+                                   ('scene_c', 'error')])
+        self.assertEqual(response.data['jobs'][3]['status'], 'rendering')
+        self.assertEqual(Job.objects.get(name='scene_b').status, self.queued_status)
+        self.assertEqual(JobTask.objects.filter(job__name='scene_a').count(), 0)
+
+    def test_failed_report_rolls_back_its_counters(self):
+        self.create_job('scene_a', status=self.rendering_status)
+        ledger_spent = BalanceLedger.for_user(self.user).spent_amount
+
+        reports = [{'job_name': 'scene_a', 'tasks_count': 2, 'tasks': {'1': {'render_time': 2, 'frame_list': '[1]'}}}]
+        request = APIRequestFactory().put('/api-job/jobs/', {'jobs': reports}, format='json')
+        force_authenticate(request, user=self.user)
+        with mock.patch.object(JobBatchAPI, 'apply_report', side_effect=ValueError('report failed')):
+            response = JobBatchAPI.as_view()(request)
+
+        self.assertEqual(response.data['jobs'][0]['result'], 'error')
+        job = Job.objects.get(name='scene_a')
+        self.assertEqual((job.cost, job.frame_count), (0, 0))
+        self.assertEqual(job.jobtask_set.count(), 0)
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, ledger_spent)
+
+
+class JobStatusAPITestCase(JobTestCase):
+
+    def get(self, etag=None, **params):
+        request = APIRequestFactory().get('/api-job/jobs/status/', params, HTTP_IF_NONE_MATCH=etag or '')
+        force_authenticate(request, user=self.user)
+        return JobStatusAPI.as_view()(request)
+
+    def test_unchanged_poll_is_not_modified(self):
+        job = self.create_job('scene_a')
+        self.create_job('scene_b')
+
+        response = self.get(names='scene_a,scene_b')
+        self.assertEqual([record['name'] for record in response.data['jobs']], ['scene_a', 'scene_b'])
+        self.assertNotIn('data', response.data['jobs'][0])
+
+        self.assertEqual(self.get(response['ETag'], names='scene_a,scene_b').status_code, 304)
+
+        job.progress = 50
+        job.save()
+        changed_response = self.get(response['ETag'], names='scene_a,scene_b')
+        self.assertEqual(changed_response.status_code, 200)
+        self.assertNotEqual(changed_response['ETag'], response['ETag'])
+
+    def test_changed_since_cursor(self):
+        job = self.create_job('scene_a')
+        self.create_job('scene_b')
+
+        response = self.get(since='')
+        self.assertEqual(len(response.data['jobs']), 2)
+        self.assertEqual(self.get(since=response.data['cursor']).data['jobs'], [])
+
+        job.progress = 50
+        job.save()
+        response = self.get(since=response.data['cursor'])
+        self.assertEqual([record['name'] for record in response.data['jobs']], ['scene_a'])
+
+    def test_cursor_keeps_jobs_sharing_a_timestamp(self):
+        first_job = self.create_job('scene_a')
+        second_job = self.create_job('scene_b')
+        Job.objects.filter(pk__in=[first_job.pk, second_job.pk]).update(date_modified=timezone.now())
+
+        with mock.patch.object(JobStatusAPI, 'max_jobs', 1):
+            response = self.get(since='')
+            self.assertEqual([record['name'] for record in response.data['jobs']], ['scene_a'])
+
+            response = self.get(since=response.data['cursor'])
+            self.assertEqual([record['name'] for record in response.data['jobs']], ['scene_b'])
+
+            self.assertEqual(self.get(since=response.data['cursor']).data['jobs'], [])
+
+
+class JobRevisionTestCase(JobTestCase):
+
+    def test_stale_save_is_rejected(self):
+        job = self.create_job()
+        stale_job = self.get_job(job)
+
+        job.progress = 10
+        job.save()
+        stale_job.progress = 20
+        with self.assertRaises(JobRevisionConflict):
+            stale_job.save()
+
+        stale_job.save_changes(lambda changed_job: setattr(changed_job, 'deadline_id', 'deadline_1'))
+        job = self.get_job(job)
+        self.assertEqual((job.progress, job.deadline_id, job.revision), (10, 'deadline_1', 2))
+
+    def test_retry_checks_guards_on_the_reloaded_job(self):
+        deleted_status = JobStatus.objects.create(name='deleted', display_name='Deleted')
+        job = self.create_job()
+        stale_job = self.get_job(job)
+
+        job.status = deleted_status
+        job.save()
+
+        def apply_changes(changed_job):
+            if changed_job.status.name == 'deleted':
+                return False
+            changed_job.status = self.rendering_status
+
+        self.assertFalse(stale_job.save_changes(apply_changes))
+        self.assertEqual(self.get_job(job).status, deleted_status)
+
+    def test_counters_are_added_in_database(self):
+        job = self.create_job()
+        stale_job = self.get_job(job)
+
+        job.update_counters(cost=1.5, frame_count=2)
+        stale_job.update_counters(cost=2.5, frame_count=3)
+
+        self.assertEqual((stale_job.cost, stale_job.frame_count), (4.0, 5))
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, 4.0)
+        with self.assertRaises(JobRevisionConflict):
+            stale_job.save()
+
+
+class JobConcurrencyTestCase(JobTestMixin, TransactionTestCase):
+
+    def test_concurrent_task_reports_keep_cost(self):
+        self.user.profile.credit = 100
+        self.user.profile.save()
+        job = self.create_job(status=self.rendering_status)
+        job.deadline_tasks_count = 40
+        job.save()
+
+        def put(task_id):
+            try:
+                tasks = {str(task_id): {'render_time': 2, 'frame_list': f'[{task_id}]'}}
+                request = APIRequestFactory().put('/api-job/job/', {'job_name': job.name, 'tasks_count': 40,
+                                                                    'progress': task_id, 'tasks': json.dumps(tasks)})
+                force_authenticate(request, user=self.user)
+                return JobAPI.as_view()(request).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            status_codes = list(executor.map(put, range(40)))
+
+        job = self.get_job(job)
+        self.assertEqual(set(status_codes), {200})
+        self.assertAlmostEqual(job.cost, 40 * 2 * self.render_plan.rate_per_min)
+        self.assertEqual(job.frame_count, 40)
+        self.assertAlmostEqual(BalanceLedger.for_user(self.user).spent_amount, job.cost)
+
+    @mock.patch.object(Job, 'send_socket_job_update')
+    def test_socket_update_is_sent_on_commit(self, send_socket_job_update):
+        self.socket_patcher.stop()
+        job = self.get_job(self.create_job(status=self.rendering_status))
+        send_socket_job_update.reset_mock()
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                job.progress = 10
+                job.save()
+                self.assertFalse(send_socket_job_update.called)
+                raise ValueError('rolled back')
+        self.assertFalse(send_socket_job_update.called)
+
+        job = self.get_job(job)
+        job.progress = 20
+        job.save()
+        send_socket_job_update.assert_called_once_with('patch_job')
+
+
+class TaskIngestionTestCase(JobTestCase):
+
+    def test_frame_count_follows_reported_tasks(self):
+        job = self.get_job(self.create_job())
+        report = {'1': {'render_time': 2, 'frame_list': '[1, 2, 3]'},
+                  '2': {'render_time': 2, 'frame_list': '[4, 5]'}}
+
+        ingest_task_reports(job, report)
+        self.assertEqual(job.frame_count, 5)
+
+        # a task reported again replaces its previous frames
+        ingest_task_reports(job, {'2': {'render_time': 2, 'frame_list': '[4, 5, 6, 7]'}})
+        self.assertEqual(job.frame_count, 7)
+
+
+class KeysetPaginationTestCase(JobTestCase):
+
+    def test_pages_follow_cursor(self):
+        jobs = [self.create_job(f'scene_{index}') for index in range(5)]
+        paginator = KeysetPaginationMixin()
+
+        pages = []
+        cursor = ''
+        while True:
+            paginator.request = RequestFactory().get('/', {'after': cursor})
+            _, page, object_list, has_next = paginator.paginate_queryset(Job.objects.filter(user=self.user), 2)
+            pages.append([job.pk for job in object_list])
+            if not has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(pages, [[jobs[4].pk, jobs[3].pk], [jobs[2].pk, jobs[1].pk], [jobs[0].pk]])
+
+
+class QueryPlanTestCase(JobTestCase):
+    """
+    explain the hottest lookups with sequential scans disabled, a seq scan left in
+    the plan means no index can serve the query.
+    """
+
+    def setUp(self):
+        super(QueryPlanTestCase, self).setUp()
+        jobs = Job.objects.bulk_create([Job(user=self.user,
+                                            name=f'scene_{index}',
+                                            frame_list=['1-10'],
+                                            status=self.queued_status if index % 2 else self.rendering_status,
+                                            render_plan=self.render_plan,
+                                            data=job_utils.get_job_schema()) for index in range(200)])
+        JobTask.objects.bulk_create([JobTask(job=job, deadline_task_id=task_id, frame_list='[1]')
+                                     for job in jobs[:20] for task_id in range(10)])
+        self.job = jobs[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertNoSeqScan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan, plan)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_job_by_name(self):
+        self.assertNoSeqScan(Job.objects.filter(name='scene_10'))
+
+    def test_jobs_by_user_and_status(self):
+        self.assertUsesIndex(Job.objects.filter(user=self.user, status=self.rendering_status),
+                             'job_job_user_id_4126db_idx')
+
+    def test_job_list_page(self):
+        self.assertNoSeqScan(Job.objects.filter(user=self.user).order_by('-date_created', '-id')[:11])
+
+    def test_tasks_by_deadline_id(self):
+        self.assertUsesIndex(self.job.jobtask_set.filter(deadline_task_id__in=[1, 2, 3]),
+                             'job_jobtask_job_id_96ef23_idx')
+
+
+class FrameRangeTestCase(SimpleTestCase):
+
+    def test_parse_frame_ranges(self):
+        ranges = frames.parse_frame_ranges('1-100:2,150')
+
+        self.assertEqual(ranges, [(1, 100, 2), (150, 150, 1)])
+        self.assertRaises(ValueError, frames.parse_frame_ranges, '1-a')
+
+    def test_task_frame_list_display(self):
+        self.assertEqual(job_utils.list_to_range('[0, 1, 2, 3, 7, 9, 10]'), '0-3,7,9-10')
+        self.assertEqual(frames.count_frame_numbers('[0, 1, 2, 3, 7, 9, 10]'), 7)
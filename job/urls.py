@@ -16,5 +16,8 @@ urlpatterns = [
 # api routes
 urlpatterns += [
     path('api-job/job/', job_api_views.JobAPI.as_view()),
+    path('api-job/job/spec/', job_api_views.JobSpecAPI.as_view(), name='job_spec'),
+    path('api-job/jobs/', job_api_views.JobBatchAPI.as_view()),
+    path('api-job/jobs/status/', job_api_views.JobStatusAPI.as_view()),
     path('api-job/submit_session/', job_api_views.SubmitSessionAPI.as_view()),
 ]
\ No newline at end of file
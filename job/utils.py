@@ -1,23 +1,15 @@
 import re
-import itertools
 
+from job import frames
 
-def validate_frame_list(items):
-    range_pattern_string = r"^(\d+)-{1}(\d+):?(\d+)?"
-    single_pattern_string = r"^(\d+)$"
-
-    range_pattern = re.compile(range_pattern_string)
-    single_pattern = re.compile(single_pattern_string)
 
+def validate_frame_list(items):
     for item in items:
-
-        single_result = single_pattern.findall(item)
-        if single_result:
-            return True
-
-        range_result = range_pattern.findall(item)
-        if range_result:
+        try:
+            frames.parse_frame_ranges(item)
             return True
+        except ValueError:
+            continue
 
     return "No valid frame list format found."
 
@@ -38,38 +30,8 @@ def validate_file_name(name):
 
 
 def list_to_range(sequence):
-    sequence = eval(sequence)
-
-    def make_ranges(sequence_list):
-        for a, b in itertools.groupby(enumerate(sequence_list), lambda pair: pair[1] - pair[0]):
-            b = list(b)
-            yield b[0][1], b[-1][1]
-
-    try:
-        result = list(make_ranges(sequence))
-        if not result:
-            return
-        if len(result) == 1:
-            return f"{result[0][0]}-{result[0][1]}"
-
-        ranges = []
-        for item in result:
-            first, last = item
-            if not first or not last:
-                continue
-
-            if first == last:
-                ranges.append(str(first))
-                continue
-
-            ranges.append(f"{first}-{last}")
-
-        if not ranges:
-            return
-
-        return ",".join(ranges)
-    except Exception as err:
-        print(err)
+    ranges = frames.compact_frames(frames.parse_frame_numbers(sequence))
+    return frames.format_frame_ranges(ranges) or None
 
 
 def get_job_schema():
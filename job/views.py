@@ -12,10 +12,12 @@ from job.models import *
 from job.forms import *
 from system.dbx_utils import DropboxHandler
 from job import utils as job_utils
+from job.registry import statuses
 
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from users.decorators import blocked_validation
+from rendershot_django.pagination import KeysetPaginationMixin
 
 
 def rgb_to_hex(r, g, b):
@@ -26,7 +28,7 @@ def hex_to_rgb(hx):
     return int(hx[0:2], 16), int(hx[2:4], 16), int(hx[4:6], 16)
 
 
-class JobListView(ListView):
+class JobListView(KeysetPaginationMixin, ListView):
     model = Job
     paginate_by = 10
     context_object_name = 'jobs'
@@ -39,21 +41,22 @@ class JobListView(ListView):
         return super().dispatch(*args, **kwargs)
 
     def get_queryset(self):
-        deleted_status = JobStatus.objects.filter(name='deleted').first()
+        deleted_status = statuses.get('deleted')
         self.queryset = Job.objects.filter(user=self.request.user).exclude(status=deleted_status)
 
         return super(JobListView, self).get_queryset()
 
     def get(self, request, *args, **kwargs):
-        deleted_status = JobStatus.objects.filter(name='deleted').first()
-        rendering_status = JobStatus.objects.filter(name='rendering').first()
-        completed_status = JobStatus.objects.filter(name='completed').first()
-        failed_status = JobStatus.objects.filter(name='failed').first()
+        deleted_status = statuses.get('deleted')
+        rendering_status = statuses.get('rendering')
+        completed_status = statuses.get('completed')
+        failed_status = statuses.get('failed')
 
-        count_all = Job.objects.filter(user=self.request.user).exclude(status=deleted_status).count()
-        count_rendering = Job.objects.filter(user=self.request.user, status=rendering_status).count()
-        count_completed = Job.objects.filter(user=self.request.user, status=completed_status).count()
-        count_failed = Job.objects.filter(user=self.request.user, status=failed_status).count()
+        status_counts = Job.status_counts(self.request.user)
+        count_all = sum(count for status_id, count in status_counts.items() if status_id != deleted_status.pk)
+        count_rendering = status_counts.get(rendering_status.pk, 0)
+        count_completed = status_counts.get(completed_status.pk, 0)
+        count_failed = status_counts.get(failed_status.pk, 0)
 
         self.extra_context = {'count_all': count_all,
                               'count_rendering': count_rendering,
@@ -211,7 +214,7 @@ class SubmitJobView(FormView):
                    'render_plan': render_plan,
                    'file_storage': file_storage,
                    'output_format': output_format,
-                   'status': JobStatus.objects.filter(name='submitted').first(),
+                   'status': statuses.get('submitted'),
                    'progress': float(),
                    'software_version': version,
                    'data': job_schema,
@@ -736,7 +739,7 @@ class AdvancedSubmitterView(FormView):
                    'name': job_name,
                    'render_plan': render_plan,
                    'frame_list': [frame_list, ],
-                   'status': JobStatus.objects.filter(name='submitted').first(),
+                   'status': statuses.get('submitted'),
                    'software_version': keyshot_version,
                    'data': data}
 
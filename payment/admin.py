@@ -1,5 +1,5 @@
 from django.contrib import admin
-from payment.models import Payment, PromotionPackage, CouponCodes
+from payment.models import Payment, PromotionPackage, CouponCodes, BalanceLedger
 
 
 class PaymentAdmin(admin.ModelAdmin):
@@ -33,6 +33,13 @@ class CouponAdmin(admin.ModelAdmin):
     search_fields = ('code', 'amount', 'is_redeemed')
 
 
+class BalanceLedgerAdmin(admin.ModelAdmin):
+    list_display = ['user', 'spent_amount', 'date_modified']
+    readonly_fields = ['spent_amount']
+    search_fields = ('user__username', )
+
+
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(PromotionPackage, PromotionPackageAdmin)
 admin.site.register(CouponCodes, CouponAdmin)
+admin.site.register(BalanceLedger, BalanceLedgerAdmin)
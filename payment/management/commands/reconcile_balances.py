@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db.models import Sum
+
+from job.models import Job
+from payment.models import BalanceLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild user spent ledgers from job history and report drift, credit stays on the profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='usernames', action='append', default=[],
+                            help='Only reconcile the given username, can be repeated.')
+        parser.add_argument('--tolerance', type=float, default=0.01,
+                            help='Ignore drift smaller than this amount.')
+        parser.add_argument('--fix', action='store_true',
+                            help='Write the rebuilt totals back to the ledgers.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('username')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        spent_amounts = dict(Job.objects.filter(user__in=users)
+                             .values('user_id')
+                             .annotate(total=Sum('cost'))
+                             .values_list('user_id', 'total'))
+
+        ledgers = {ledger.user_id: ledger for ledger in BalanceLedger.objects.filter(user__in=users)}
+
+        tolerance = options['tolerance']
+        drift_count = 0
+        for user in users:
+            spent_amount = spent_amounts.get(user.id) or float()
+            ledger = ledgers.get(user.id)
+
+            if not ledger:
+                drift = 'ledger missing'
+            elif abs((ledger.spent_amount or float()) - spent_amount) > tolerance:
+                drift = f'spent {ledger.spent_amount} >> {spent_amount}'
+            else:
+                continue
+
+            drift_count += 1
+            self.stdout.write(self.style.WARNING(f'{user.username} : {drift}'))
+
+            if options['fix']:
+                BalanceLedger.objects.update_or_create(user=user, defaults={'spent_amount': spent_amount})
+
+        summary = f'{drift_count} of {len(users)} users drifted.'
+        if options['fix'] and drift_count:
+            summary += ' ledgers rebuilt from history.'
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,41 @@
+# Generated by Django 3.1 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def seed_balance_ledgers(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Job = apps.get_model('job', 'Job')
+    BalanceLedger = apps.get_model('payment', 'BalanceLedger')
+
+    spent_amounts = dict(Job.objects.values('user_id').annotate(total=Sum('cost')).values_list('user_id', 'total'))
+
+    ledgers = [BalanceLedger(user_id=user_id, spent_amount=spent_amounts.get(user_id) or 0.0)
+               for user_id in User.objects.values_list('id', flat=True)]
+    BalanceLedger.objects.bulk_create(ledgers, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0007_profile_chunk_size_override'),
+        ('job', '0016_submitsession_user'),
+        ('payment', '0006_auto_20210514_0503'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceLedger',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spent_amount', models.FloatField(default=0.0)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(seed_balance_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1 on 2026-10-18 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payment', '0007_balanceledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-date_created', '-id'], name='payment_pay_user_id_aa529c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0008_auto_20261018_1410'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_id',
+            field=models.CharField(blank=True, db_index=True, max_length=200, null=True),
+        ),
+    ]
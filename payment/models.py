@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
 from django.urls import reverse
+from django.utils import timezone
 
 from colorfield.fields import ColorField
 from rendershot_django.utils import get_random_code, post_message_to_slack, send_update_email
@@ -36,13 +38,17 @@ class Payment(models.Model):
     type = models.CharField(max_length=100, null=True, choices=PaymentTypes.choices, default=PaymentTypes.PAYPAL)
     status = models.CharField(max_length=100, null=True, choices=PaymentStatus.choices, default=PaymentStatus.INITIATED)
     amount = models.FloatField(default=5.0, null=True)
-    payment_id = models.CharField(max_length=200, null=True, blank=True)
+    payment_id = models.CharField(max_length=200, null=True, blank=True, db_index=True)
     order_data = models.JSONField(null=True, blank=True)
     payment_data = models.JSONField(null=True, blank=True)
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
     currency = models.CharField(max_length=100, null=True, choices=Currencies.choices, default=Currencies.USD)
 
+    class Meta:
+        # backs the keyset paginated invoice list
+        indexes = [models.Index(fields=['user', '-date_created', '-id'])]
+
     def __init__(self, *args, **kwargs):
         self.status_signals = {'on_initiated': self.on_initiated,
                                'on_pending': self.on_pending,
@@ -72,24 +78,27 @@ class Payment(models.Model):
     def on_pending(self):
         self.slack_payment_update('on_payment_pending')
 
-    def on_completed(self):
+    @property
+    def credit_delta(self):
+        amount = float(self.amount or 0.0)
 
-        if self.type == PaymentTypes.PAYPAL:
-            self.user.profile.credit += self.amount
-        elif self.type == PaymentTypes.COUPON:
-            self.user.profile.credit += self.amount
-        elif self.type == PaymentTypes.CREDIT_REFUND:
-            self.user.profile.credit += self.amount
-        elif self.type == PaymentTypes.PAYMENT_REFUND:
-            self.user.profile.credit -= self.amount
-        elif self.type == PaymentTypes.CREDIT_TRANSFER:
-            self.user.profile.credit += self.amount
-        elif self.type == PaymentTypes.PROMOTION:
-            self.user.profile.credit += self.amount
-        elif self.type == PaymentTypes.COST_BALANCE:
-            self.user.profile.credit -= self.amount  # could be negative
+        if self.type in [PaymentTypes.PAYPAL,
+                         PaymentTypes.COUPON,
+                         PaymentTypes.CREDIT_REFUND,
+                         PaymentTypes.CREDIT_TRANSFER,
+                         PaymentTypes.PROMOTION]:
+            return amount
+        elif self.type in [PaymentTypes.PAYMENT_REFUND,
+                           PaymentTypes.COST_BALANCE]:
+            return -amount
+
+        return float()
 
+    def on_completed(self):
+        credit_delta = self.credit_delta
+        self.user.profile.credit += credit_delta
         self.user.save()
+
         self.email_payment_update()
         self.slack_payment_update('on_payment_completed')
 
@@ -168,6 +177,52 @@ class Payment(models.Model):
         post_message_to_slack(event, event, data)
 
 
+class BalanceLedger(models.Model):
+    """
+    incrementally maintained spent total per user, so reading a user balance does not walk
+    every job. credit stays on Profile.credit. use the reconcile_balances command to rebuild
+    it from job history.
+    """
+
+    user = models.OneToOneField(User, null=True, on_delete=models.CASCADE)
+    spent_amount = models.FloatField(default=0.0)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.user.username
+
+    @classmethod
+    def for_user(cls, user):
+        ledger = cls.objects.filter(user=user).first()
+        if not ledger:
+            ledger = cls.seed(user)
+        return ledger
+
+    @classmethod
+    def seed(cls, user):
+        spent_amount = user.job_set.aggregate(total=Sum('cost')).get('total') or float()
+        ledger, created = cls.objects.get_or_create(user=user, defaults={'spent_amount': spent_amount})
+        return ledger
+
+    @classmethod
+    def add_spent(cls, user_id, amount, seed_missing=True):
+        cls._apply(user_id, seed_missing, spent_amount=amount)
+
+    @classmethod
+    def _apply(cls, user_id, seed_missing, **amounts):
+        amounts = {field: amount for field, amount in amounts.items() if amount}
+        if not user_id or not amounts:
+            return
+
+        updates = {field: F(field) + amount for field, amount in amounts.items()}
+        with transaction.atomic():
+            updated = cls.objects.filter(user_id=user_id).update(date_modified=timezone.now(), **updates)
+
+            # a freshly seeded ledger already reflects the change that triggered this call
+            if not updated and seed_missing:
+                cls.seed(User.objects.get(pk=user_id))
+
+
 class PromotionPackage(models.Model):
 
     name = models.CharField(max_length=100, null=True)
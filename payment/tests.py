@@ -1,6 +1,14 @@
+from io import StringIO
+from unittest import mock
+
+from django.db import connection
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth.models import User
-from payment.models import Payment, PaymentStatus
+
+from job.tests import JobTestMixin
+from payment.models import Payment, PaymentStatus, BalanceLedger
+from users.models import Profile
 
 
 def create_fake_payments():
@@ -10,4 +18,63 @@ def create_fake_payments():
         payment.save()
 
 
-create_fake_payments()
\ No newline at end of file
+class BalanceLedgerTestCase(JobTestMixin, TestCase):
+
+    def test_balance_reads_profile_credit_and_ledger_spent(self):
+        job = self.create_job()
+        job.cost = 2.5
+        job.save()
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, 2.5)
+
+        # credit adjusted by hand in the profile admin counts right away
+        profile = User.objects.get(pk=self.user.pk).profile
+        profile.credit = 10
+        profile.save()
+        self.assertEqual(profile.balance, 7.5)
+        self.assertEqual(Profile.get_balances([self.user.pk]), {self.user.pk: 7.5})
+
+        job.delete()
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, 0)
+
+    def test_save_without_cost_change_skips_ledger(self):
+        job = self.get_job(self.create_job())
+
+        with mock.patch.object(BalanceLedger, 'add_spent') as add_spent:
+            job.progress = 50
+            job.save()
+            self.assertFalse(add_spent.called)
+
+            job.cost = 1.5
+            job.save()
+        add_spent.assert_called_once_with(self.user.pk, 1.5)
+
+    def test_reconcile_rebuilds_spent_only(self):
+        job = self.create_job()
+        job.cost = 4.0
+        job.save()
+        self.user.profile.credit = 10
+        self.user.profile.save()
+        BalanceLedger.objects.filter(user=self.user).update(spent_amount=1.0)
+
+        call_command('reconcile_balances', stdout=StringIO())
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, 1.0)
+
+        call_command('reconcile_balances', '--fix', stdout=StringIO())
+        self.assertEqual(BalanceLedger.for_user(self.user).spent_amount, 4.0)
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile.credit, 10)
+
+
+class PaymentQueryPlanTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('render_user', 'render_user@rendershot.com', 'render_password')
+        Payment.objects.bulk_create([Payment(user=user, amount=10.0, payment_id=f'PAYID-{index}')
+                                     for index in range(200)])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_payment_by_payment_id(self):
+        plan = Payment.objects.filter(payment_id='PAYID-10').explain()
+        self.assertNotIn('Seq Scan', plan, plan)
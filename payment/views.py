@@ -14,6 +14,7 @@ from payment.models import PromotionPackage, CouponCodes, Payment, PaymentStatus
 from payment.mixins import PaypalCreateOrderMixin, PaypalCaptureOrderMixin
 from payment.utils import render_pdf_view
 from system import utils as system_utils
+from rendershot_django.pagination import KeysetPaginationMixin
 
 
 class PaymentView(View):
@@ -165,7 +166,7 @@ class PaymentView(View):
         return redirect('payment')
 
 
-class InvoiceView(ListView):
+class InvoiceView(KeysetPaginationMixin, ListView):
     model = Payment
     paginate_by = 10
     context_object_name = 'payments'
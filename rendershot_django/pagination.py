@@ -0,0 +1,59 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(item, field='date_created'):
+    value = f"{getattr(item, field).isoformat()}|{item.pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date_created, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return parse_datetime(date_created), int(pk)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """ page_obj replacement for keyset pages, there is no page number or total count """
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return bool(self.next_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    paginate a ListView on (date_created, id), newest first, with an opaque cursor
+    to the last row of the previous page instead of an offset, so deep pages cost
+    the same as the first one. the next page link is ?after={{ page_obj.next_cursor }}.
+    """
+    cursor_param = 'after'
+
+    def paginate_queryset(self, queryset, page_size):
+        queryset = queryset.order_by('-date_created', '-id')
+
+        cursor = decode_cursor(self.request.GET.get(self.cursor_param) or '')
+        if cursor and cursor[0]:
+            date_created, pk = cursor
+            queryset = queryset.filter(Q(date_created__lt=date_created) | Q(date_created=date_created, id__lt=pk))
+
+        object_list = list(queryset[:page_size + 1])
+        has_next = len(object_list) > page_size
+        object_list = object_list[:page_size]
+
+        page = KeysetPage(object_list, encode_cursor(object_list[-1]) if has_next else None)
+        return None, page, object_list, has_next
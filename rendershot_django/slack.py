@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger('Slack')
+
+SLACK_POST_MESSAGE_URL = 'https://slack.com/api/chat.postMessage'
+SLACK_ICON_URL = 'https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcTuGqps7ZafuzUsViFGIremEL2a3NR0KO0s0RTCMXmzmREJd5m4MA&s'
+
+# connect and read timeouts in seconds
+SLACK_TIMEOUT = (3.05, 10)
+
+# slack accepts at most 50 blocks per message, every digest entry uses a divider and a section
+DIGEST_ENTRIES_PER_MESSAGE = 24
+
+
+class SlackRateLimited(Exception):
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super(SlackRateLimited, self).__init__(f"slack rate limited, retry after {retry_after} seconds")
+
+
+def get_slack_channel(model_type=None):
+    if model_type and model_type == 'ticket':
+        return '#rendershot_ticket'
+    return '#rendershot_notification'
+
+
+def formatted_data(data):
+    output = ''
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            output += f"{key} : {value}\n"
+
+    return output
+
+
+def get_message_blocks(subject, data):
+    return [{"type": "divider"},
+            {"type": "section",
+             "text": {"type": "mrkdwn",
+                      "text": f"*{subject}*\n{formatted_data(data)}"}}, ]
+
+
+class SlackNotifier:
+    """
+    posts to slack over one keep-alive session per process, with timeouts and
+    rate limit awareness: after a 429 every post fails fast until retry-after passed.
+    """
+
+    def __init__(self, timeout=SLACK_TIMEOUT):
+        self.timeout = timeout
+        self._session = None
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    @property
+    def token(self):
+        return os.getenv('SLACK_TOKEN', '')
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+            return self._session
+
+    def post(self, channel, text, blocks=None):
+        if not self.token:
+            return
+
+        retry_after = self._blocked_until - time.monotonic()
+        if retry_after > 0:
+            raise SlackRateLimited(retry_after)
+
+        response = self.session.post(SLACK_POST_MESSAGE_URL,
+                                     {'token': self.token,
+                                      'channel': channel,
+                                      'text': text,
+                                      'icon_url': SLACK_ICON_URL,
+                                      'username': os.getenv('SLACK_USER_NAME'),
+                                      'blocks': json.dumps(blocks) if blocks else None},
+                                     timeout=self.timeout)
+
+        if response.status_code == 429:
+            retry_after = float(response.headers.get('Retry-After', 1))
+            self._blocked_until = time.monotonic() + retry_after
+            logger.warning(f"slack rate limited on {channel}, retry after {retry_after} seconds")
+            raise SlackRateLimited(retry_after)
+
+        response.raise_for_status()
+        return response
+
+    def post_message(self, popup_text, subject, data, model_type=None):
+        return self.post(get_slack_channel(model_type), popup_text, get_message_blocks(subject, data))
+
+    def post_digest(self, channel, messages):
+        """
+        merge (popup_text, subject, data) messages into as few slack messages as the
+        block limit allows.
+        """
+        for start in range(0, len(messages), DIGEST_ENTRIES_PER_MESSAGE):
+            chunk = messages[start:start + DIGEST_ENTRIES_PER_MESSAGE]
+            if len(chunk) == 1:
+                popup_text, subject, data = chunk[0]
+                self.post(channel, popup_text, get_message_blocks(subject, data))
+                continue
+
+            popup_texts = []
+            blocks = []
+            for popup_text, subject, data in chunk:
+                if popup_text not in popup_texts:
+                    popup_texts.append(popup_text)
+                blocks.extend(get_message_blocks(subject, data))
+
+            self.post(channel, f"{len(chunk)} updates : {', '.join(popup_texts)}", blocks)
+
+
+notifier = SlackNotifier()
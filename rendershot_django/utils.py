@@ -1,10 +1,10 @@
-import os
 import secrets
 import string
-import requests
 import json
-import pprint
+import logging
 
+from django.db import transaction
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
 from django.template.loader import render_to_string
 
@@ -12,12 +12,28 @@ from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters import get_formatter_by_name
 
+from rendershot_django.slack import notifier
+
 
 def get_random_code(lenght=5):
     random_str = ''.join((secrets.choice(string.ascii_letters) for i in range(lenght)))
     return random_str
 
 
+def bump_cache_version(key):
+    """
+    increment a shared cache version once the current transaction commits, processes
+    comparing it with their local copy then reload rows that other processes can read.
+    """
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    transaction.on_commit(bump)
+
+
 def reformat_json(instance):
     response = json.dumps(instance.data, sort_keys=True, indent=2)
     formatter = get_formatter_by_name('html')
@@ -26,40 +42,11 @@ def reformat_json(instance):
     return mark_safe(style + response)
 
 
-def formatted_data(data):
-    output = ''
-    for key, value in data.items():
-        if not isinstance(value, dict):
-            output += f"{key} : {value}\n"
-
-    return output
-
-
 def post_message_to_slack(popup_text, subject, data, model_type=None):
-    if model_type and model_type == 'ticket':
-        slack_channel = '#rendershot_ticket'
-    else:
-        slack_channel = '#rendershot_notification'
-
-    slack_token = os.getenv('SLACK_TOKEN', '')
-    if not slack_token:
-        return
-
-    slack_icon_url = 'https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcTuGqps7ZafuzUsViFGIremEL2a3NR0KO0s0RTCMXmzmREJd5m4MA&s'
-    slack_user_name = os.getenv('SLACK_USER_NAME')
-
-    blocks = [{"type": "divider"},
-              {"type": "section",
-               "text": {"type": "mrkdwn",
-                        "text": f"*{subject}*\n{formatted_data(data)}"}},]
-
-    request = requests.post('https://slack.com/api/chat.postMessage',
-                            {'token': slack_token,
-                             'channel': slack_channel,
-                             'text': popup_text,
-                             'icon_url': slack_icon_url,
-                             'username': slack_user_name,
-                             'blocks': json.dumps(blocks) if blocks else None})
+    try:
+        notifier.post_message(popup_text, subject, data, model_type=model_type)
+    except Exception as err:
+        logging.getLogger('Slack').warning(f"slack message could not be posted : {subject} >> {err}")
 
 
 def send_update_email(user, context, subject, message):
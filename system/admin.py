@@ -1,7 +1,7 @@
 import json
 
 from django.db import models
-from system.models import Setting, SocketConnection
+from system.models import Setting, OutboxEvent
 from django.utils.translation import gettext_lazy as _
 from django_json_widget.widgets import JSONEditorWidget
 
@@ -38,9 +38,13 @@ class SystemSetting(admin.ModelAdmin):
     formfield_overrides = {models.JSONField: {'widget': JSONEditorWidget}, }
 
 
-class SocketConnectionAdmin(admin.ModelAdmin):
-    list_display = ['user', 'channel', 'group', 'date_created', 'date_modified']
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'event', 'user', 'status', 'attempts', 'next_attempt', 'date_created']
+    list_filter = ['kind', 'status']
+    search_fields = ('user__username', 'event')
+
+    formfield_overrides = {models.JSONField: {'widget': JSONEditorWidget}, }
 
 
 admin.site.register(Setting, SystemSetting)
-admin.site.register(SocketConnection, SocketConnectionAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
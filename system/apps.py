@@ -5,8 +5,6 @@ class SystemConfig(AppConfig):
     name = 'system'
 
     def ready(self):
-        try:
-            from system.models import SocketConnection
-            SocketConnection.objects.all().delete()
-        except Exception as err:
-            pass
\ No newline at end of file
+        # connect the dropbox storage setting cache invalidation signals
+        import system.dbx_utils
+        import system.checks
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# caches that only live in one process, the outbox worker and web processes would never see each other
+PROCESS_LOCAL_CACHES = ['django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache']
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(f"the default cache {backend} is not shared between processes",
+                        hint="share links warmed by dispatch_outbox and the reference cache versions "
+                             "only reach the web processes through a shared cache such as django_redis.",
+                        id='system.W001')]
+    return []
@@ -1,91 +1,104 @@
+import asyncio
 import logging
 import pprint
 
-from channels.generic.websocket import WebsocketConsumer
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
 
 from job.models import *
+from job.registry import statuses
 from rendershot_django.utils import post_message_to_slack
+from system import presence
 
+# slack posts block on http, so they run outside the event loop
+post_message_to_slack_async = sync_to_async(post_message_to_slack, thread_sensitive=False)
 
-class SystemConsumer(WebsocketConsumer):
+
+class SystemConsumer(AsyncWebsocketConsumer):
 
     def __init__(self, *args, **kwargs):
-        super(SystemConsumer, self).__init__()
+        super(SystemConsumer, self).__init__(*args, **kwargs)
         self.actions = {'set_deadline_ids': self.set_deadline_ids,
                         'set_new_status': self.set_new_status}
 
         self.group_name = ''
+        self.user_group = ''
+        self.presence_heartbeat = None
         self.log = logging.getLogger('SystemSocket')
 
-    def connect(self):
+    async def connect(self):
 
         if self.scope['user'].is_superuser:
             self.group_name = 'admin'
         else:
             self.group_name = 'client'
 
-        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
-        self.accept()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
 
         if self.scope['user'].is_anonymous:
             self.log.debug(f'anonymous user detected. closing socket.')
-            self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
-            self.close()
+            await self.send(text_data=json.dumps({'message': "Access token could not be validated."}))
+            await self.close()
             return
 
         if not self.group_name:
             self.log.debug(f'invalid socket group detected. closing socket.')
-            self.send(text_data=json.dumps({'message': "Connection could not be authenticated."}))
-            self.close()
+            await self.send(text_data=json.dumps({'message': "Connection could not be authenticated."}))
+            await self.close()
             return
 
-        self.log.debug(f'creating socket connection database object : {self.scope["user"].username}')
+        self.log.debug(f'joining user socket group : {self.scope["user"].username}')
         if not isinstance(self.scope["user"], User):
             self.log.debug(f'bad user instance detected : {self.scope["user"].username} - {type(self.scope["user"])}')
-            self.send(text_data=json.dumps({'message': "User is not validated."}))
-            self.close()
+            await self.send(text_data=json.dumps({'message': "User is not validated."}))
+            await self.close()
             return
 
-        socket_conn = SocketConnection.objects.create(user=self.scope["user"],
-                                                      channel=self.channel_name,
-                                                      group=self.group_name)
-        socket_conn.save()
-        self.send(text_data=json.dumps({'message': f"{self.group_name} connected."}))
+        self.user_group = presence.user_group(self.group_name, self.scope['user'].id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await sync_to_async(presence.add, thread_sensitive=False)(self.group_name, self.scope['user'].id,
+                                                                  self.channel_name)
+        self.presence_heartbeat = asyncio.ensure_future(
+            presence.heartbeat(self.group_name, self.scope['user'].id, self.channel_name))
+        await self.send(text_data=json.dumps({'message': f"{self.group_name} connected."}))
         if self.group_name == 'admin':
-            post_message_to_slack('WebSocket Connection Triggered',
-                                  f"{self.group_name} connected.",
-                                  {'user': self.scope['user'].username})
-
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(self.group_name, self.channel_name)
-
-        if isinstance(self.scope["user"], User):
-            socket_conn = SocketConnection.objects.filter(user=self.scope["user"],
-                                                          group=self.group_name,
-                                                          channel=self.channel_name).first()
-            if socket_conn:
-                socket_conn.delete()
-        self.send(text_data=json.dumps({'message': 'disconnected'}))
+            await post_message_to_slack_async('WebSocket Connection Triggered',
+                                              f"{self.group_name} connected.",
+                                              {'user': self.scope['user'].username})
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+        if self.presence_heartbeat:
+            self.presence_heartbeat.cancel()
+
+        if self.user_group:
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+            await sync_to_async(presence.remove, thread_sensitive=False)(self.group_name, self.scope['user'].id,
+                                                                         self.channel_name)
+        await self.send(text_data=json.dumps({'message': 'disconnected'}))
         if self.group_name == 'admin':
-            post_message_to_slack('WebSocket Disconnection Triggered',
-                                  f"{self.group_name} disconnected.",
-                                  {'user': self.scope['user'].username})
+            await post_message_to_slack_async('WebSocket Disconnection Triggered',
+                                              f"{self.group_name} disconnected.",
+                                              {'user': self.scope['user'].username})
 
-    def receive(self, text_data=None, bytes_data=None):
+    async def receive(self, text_data=None, bytes_data=None):
 
         data = json.loads(text_data)
         self.log.debug(pprint.pformat(data))
 
         action = self.actions.get(data.get('type', ''), '')
         if action:
-            action(data)
+            await database_sync_to_async(action)(data)
 
-    def send_message(self, event):
+    async def send_message(self, event):
         self.log.debug(pprint.pformat(event))
         # event.pop('type')
         if event.get('data'):
             formatted_data = json.dumps(event)
-            self.send(text_data=formatted_data)
+            await self.send(text_data=formatted_data)
 
     def set_deadline_ids(self, data):
         job_name = data.get('job_name')
@@ -95,8 +108,7 @@ class SystemConsumer(WebsocketConsumer):
         if not job:
             return
         if ids:
-            job.deadline_id = ids
-            job.save()
+            job.save_changes(lambda changed_job: setattr(changed_job, 'deadline_id', ids))
 
     def set_new_status(self, data):
         job_name = data.get('job_name')
@@ -105,14 +117,15 @@ class SystemConsumer(WebsocketConsumer):
         if not job:
             return
 
-        if job.status.name == 'deleted':
-            return
-
         status_name = data.get('status')
-        status = JobStatus.objects.filter(name=status_name).first()
+        status = statuses.get(status_name)
         if not status:
             return
 
-        job.status = status
-        job.save()
+        def apply_changes(changed_job):
+            # checked on every attempt, a retry must not bring back a job deleted in between
+            if changed_job.status.name == 'deleted':
+                return False
+            changed_job.status = status
 
+        job.save_changes(apply_changes)
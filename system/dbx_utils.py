@@ -1,20 +1,115 @@
 import os
+import hashlib
 import logging
+import threading
 
 import dropbox
 import dropbox.exceptions
+import dropbox.files
 import packaging.version
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
 
 from job.models import FileStorage
+from rendershot_django.utils import bump_cache_version
 
 logger = logging.getLogger('DBX')
 
+STORAGE_VERSION_KEY = 'dropbox_storage_version'
+DROPBOX_TIMEOUT = 60
+DROPBOX_MAX_CONNECTIONS = 16
+
+# share links do not change until revoked, they are kept until the path is invalidated or the timeout
+SHARE_LINK_TIMEOUT = getattr(settings, 'DROPBOX_SHARE_LINK_TIMEOUT', 7 * 24 * 60 * 60)
+# the source index is refreshed from its cursor on every read, the timeout only drops unused indexes
+SOURCE_INDEX_TIMEOUT = getattr(settings, 'DROPBOX_SOURCE_INDEX_TIMEOUT', 24 * 60 * 60)
+
+_lock = threading.Lock()
+_storage_setting = None
+_storage_version = None
+_clients = dict()
+
+
+def get_storage_setting():
+    """
+    RenderShare storage setting, read once per process and again only after the
+    FileStorage rows changed in this or any other process.
+    """
+    global _storage_setting, _storage_version
+
+    version = cache.get(STORAGE_VERSION_KEY, 0)
+    with _lock:
+        if _storage_setting is None or version != _storage_version:
+            dropbox_storage = FileStorage.objects.filter(name='RenderShare').first()
+            _storage_setting = dict(dropbox_storage.setting or {}) if dropbox_storage else dict()
+            _storage_version = version
+            # clients of a replaced token are never used again
+            _clients.clear()
+
+        return _storage_setting
+
+
+def get_dropbox_client(token, timeout=DROPBOX_TIMEOUT):
+    """ shared client per token, its http session keeps connections to dropbox warm between requests """
+    with _lock:
+        client = _clients.get((token, timeout))
+        if client is None:
+            session = dropbox.create_session(max_connections=DROPBOX_MAX_CONNECTIONS)
+            client = dropbox.Dropbox(token, timeout=timeout, session=session)
+            _clients[(token, timeout)] = client
+        return client
+
+
+def invalidate_storage_setting(*args, **kwargs):
+    global _storage_setting
+
+    with _lock:
+        _storage_setting = None
+        _clients.clear()
+
+    bump_cache_version(STORAGE_VERSION_KEY)
+
+
+def get_share_link_key(path):
+    # dropbox paths are case insensitive
+    return f"dropbox_share_link:{hashlib.sha1(path.lower().encode()).hexdigest()}"
+
+
+def invalidate_share_link(path):
+    # dropbox only returns the path of links on files the user can see
+    if path:
+        cache.delete(get_share_link_key(path))
+
+
+def get_source_index_key(user):
+    return f"dropbox_source_index:{user.pk}"
+
+
+def invalidate_source_index(user):
+    cache.delete(get_source_index_key(user))
+
+
+class SourceFile:
+    """ the fields of a dropbox file entry the source file picker shows, kept in the cached index """
+
+    def __init__(self, entry):
+        self.name = entry.name
+        self.size = entry.size
+        self.client_modified = entry.client_modified
+        self.path_display = entry.path_display
+        self.path_lower = entry.path_lower
+
+
+post_save.connect(invalidate_storage_setting, sender=FileStorage)
+post_delete.connect(invalidate_storage_setting, sender=FileStorage)
+
 
 class DropboxHandler:
     def __init__(self, user):
         self.user = user
         self.dropbox = None
-        self._timeout = 60
+        self._timeout = DROPBOX_TIMEOUT
 
         self._token = ''
         self._sources_root = ''
@@ -26,17 +121,17 @@ class DropboxHandler:
 
     def _set_db_data(self):
         try:
-            self.dropbox_storage = FileStorage.objects.filter(name='RenderShare').first()
-            self._token = self.dropbox_storage.setting.get('token')
-            self._sources_root = self.dropbox_storage.setting.get('sources_root')
-            self._outputs_root = self.dropbox_storage.setting.get('outputs_root')
-            self._utilities_root = self.dropbox_storage.setting.get('utilities_root')
+            setting = get_storage_setting()
+            self._token = setting.get('token')
+            self._sources_root = setting.get('sources_root')
+            self._outputs_root = setting.get('outputs_root')
+            self._utilities_root = setting.get('utilities_root')
         except Exception as err:
             logger.exception(err)
 
     def _init_dropbox(self):
         try:
-            self.dropbox = dropbox.Dropbox(self._token, timeout=self._timeout)
+            self.dropbox = get_dropbox_client(self._token, timeout=self._timeout)
         except Exception as err:
             logger.exception(err)
             self.dropbox = None
@@ -96,31 +191,79 @@ class DropboxHandler:
         logger.info(f"{package_type}s found : {data}")
         return data
 
-    def get_list_of_source_files(self, formats):
-        list_of_files = []
-        try:
-            admin_entries = self.dropbox.files_list_folder(self._sources_root).entries
-        except Exception as e:
-            logger.exception(e)
-            return list_of_files
-
-        if self.user.username not in [entry.name for entry in admin_entries]:
-            logger.warning(f"{self.user.username} have no dropbox folder")
-            return list_of_files
+    def list_folder(self, path, recursive=False):
+        """ every entry of a folder, following the listing cursor until it has no more, and the last cursor """
+        result = self.dropbox.files_list_folder(path, recursive=recursive)
+        entries = list(result.entries)
+        while result.has_more:
+            result = self.dropbox.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+        return entries, result.cursor
+
+    def list_folder_changes(self, cursor):
+        """ entries changed since a listing cursor, and the cursor to continue from """
+        entries = []
+        has_more = True
+        while has_more:
+            result = self.dropbox.files_list_folder_continue(cursor)
+            entries.extend(result.entries)
+            cursor, has_more = result.cursor, result.has_more
+        return entries, cursor
+
+    def is_source_file_path(self, path_lower):
+        # source files are kept one project folder deep : sources_root/username/project/file
+        relative_path = path_lower[len(self.get_user_sources_path().lower()):].strip('/')
+        return len(relative_path.split('/')) == 2
+
+    def update_source_index(self, files, entries):
+        for entry in entries:
+            if isinstance(entry, dropbox.files.FileMetadata):
+                if self.is_source_file_path(entry.path_lower):
+                    files[entry.path_lower] = SourceFile(entry)
+            elif isinstance(entry, dropbox.files.DeletedMetadata):
+                # a deleted folder takes every file under it
+                files.pop(entry.path_lower, None)
+                folder_prefix = f"{entry.path_lower}/"
+                for path_lower in [path for path in files if path.startswith(folder_prefix)]:
+                    del files[path_lower]
+
+    def get_source_index(self):
+        """
+        files of the user sources folder, listed recursively once and then kept up to
+        date from the listing cursor, so an unchanged folder costs one api call.
+        """
+        key = get_source_index_key(self.user)
+        index = cache.get(key)
+
+        if index:
+            try:
+                entries, cursor = self.list_folder_changes(index['cursor'])
+                self.update_source_index(index['files'], entries)
+                index['cursor'] = cursor
+            except dropbox.exceptions.ApiError as err:
+                # an expired or reset cursor needs a full listing
+                logger.warning(f"{self.user.username} source index cursor is not valid anymore : {err}")
+                index = None
+
+        if not index:
+            entries, cursor = self.list_folder(self.get_user_sources_path(), recursive=True)
+            index = {'cursor': cursor, 'files': dict()}
+            self.update_source_index(index['files'], entries)
+
+        cache.set(key, index, timeout=SOURCE_INDEX_TIMEOUT)
+        return index['files']
 
-        path = os.path.join(self._sources_root, self.user.username).replace('\\', "/")
+    def get_list_of_source_files(self, formats):
         try:
-            for entry in self.dropbox.files_list_folder(path).entries:
-                sub_path = os.path.join(self._sources_root, self.user.username, entry.name).replace('\\', "/")
-                for sub_entry in self.dropbox.files_list_folder(sub_path).entries:
-                    name, ext = os.path.splitext(sub_entry.name)
-                    if ext in formats:
-                        list_of_files.append(sub_entry)
+            files = self.get_source_index()
+        except dropbox.exceptions.ApiError as err:
+            logger.warning(f"{self.user.username} have no dropbox folder : {err}")
+            return []
         except Exception as e:
             logger.exception(e)
-            return list_of_files
+            return []
 
-        return list_of_files
+        return [source_file for source_file in files.values() if os.path.splitext(source_file.name)[1] in formats]
 
     def get_list_of_output_folders(self):
         folders = []
@@ -142,6 +285,18 @@ class DropboxHandler:
         return os.path.join(self.get_user_outputs_path(), job_name).replace('\\', "/")
 
     def get_share_link(self, path):
+        """ shared link of a path, resolved with the dropbox api only when it is not cached yet """
+        key = get_share_link_key(path)
+        url = cache.get(key)
+        if url:
+            return url
+
+        url = self.resolve_share_link(path)
+        if url:
+            cache.set(key, url, timeout=SHARE_LINK_TIMEOUT)
+        return url
+
+    def resolve_share_link(self, path):
         exist_links = self.dropbox.sharing_get_shared_links(path=path)
         revoke_url = ''
         if exist_links.links:
@@ -156,6 +311,7 @@ class DropboxHandler:
         if revoke_url:
             logger.debug(f"revoking already exist url {revoke_url}")
             self.dropbox.sharing_revoke_shared_link(revoke_url)
+            invalidate_share_link(shared_link.path)
 
         exist_links = self.dropbox.sharing_get_shared_links(path=path)
         if exist_links.links:
@@ -222,8 +378,10 @@ class DropboxHandler:
     def delete_user_folders(self):
         paths = self.get_user_paths()
         logger.debug(f"deleting {self.user.username} dropbox folders : {paths}")
+        invalidate_source_index(self.user)
         try:
             for path in paths:
+                invalidate_share_link(path)
                 self.dropbox.files_delete_v2(path)
         except Exception as err:
             logger.exception(err)
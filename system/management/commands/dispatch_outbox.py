@@ -0,0 +1,40 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+
+from system import outbox
+
+logger = logging.getLogger('Outbox')
+
+
+class Command(BaseCommand):
+    help = 'Drain queued notification events (slack, email, channel layer) with batching, retries and backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Days to keep sent events before purging them.')
+        parser.add_argument('--once', action='store_true',
+                            help='Dispatch the currently due events and exit.')
+
+    def handle(self, *args, **options):
+        last_purge = 0.0
+        while True:
+            dispatched = outbox.dispatch_pending(batch_size=options['batch_size'])
+            if dispatched:
+                logger.debug(f"{dispatched} outbox events dispatched")
+
+            if options['once']:
+                if dispatched == options['batch_size']:
+                    continue
+                break
+
+            if time.monotonic() - last_purge > 3600:
+                outbox.purge_sent(days=options['keep_days'])
+                last_purge = time.monotonic()
+
+            if not dispatched:
+                time.sleep(options['interval'])
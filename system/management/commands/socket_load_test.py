@@ -0,0 +1,110 @@
+import time
+import json
+import asyncio
+import statistics
+
+import websockets
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+
+def percentile(values, percent):
+    if not values:
+        return float()
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Open concurrent websockets against a running daphne process and report how many stay responsive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose api token authenticates the sockets.')
+        parser.add_argument('--url', default='ws://127.0.0.1:8000/ws/jobs/')
+        parser.add_argument('--connections', type=int, nargs='+', default=[50, 200, 500, 1000])
+        parser.add_argument('--messages', type=int, default=5, help='Messages sent by every socket once connected.')
+        # an unknown job costs a database lookup and a template render, and gets exactly one reply
+        parser.add_argument('--payload', default='{"type": "get_job_details", "job_name": "socket_load_test"}',
+                            help='Socket message to send, it should produce exactly one reply.')
+        parser.add_argument('--timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        token = Token.objects.filter(user__username=options['username']).first()
+        if not token:
+            raise CommandError(f"api token of {options['username']} could not be found.")
+
+        self.token = token.key
+        self.options = options
+
+        self.stdout.write(f"{'sockets':>8} {'open':>6} {'failed':>7} {'connect p50':>12} {'connect p95':>12} "
+                          f"{'reply p50':>10} {'reply p95':>10} {'replies/s':>10}")
+        for connections in options['connections']:
+            result = asyncio.run(self.run_round(connections))
+            self.stdout.write(f"{connections:>8} {result['open']:>6} {result['failed']:>7} "
+                              f"{result['connect_p50'] * 1000:>10.1f}ms {result['connect_p95'] * 1000:>10.1f}ms "
+                              f"{result['reply_p50'] * 1000:>8.1f}ms {result['reply_p95'] * 1000:>8.1f}ms "
+                              f"{result['throughput']:>10.1f}")
+
+    async def run_round(self, connections):
+        # every socket waits for all the others to connect before sending, so they are open at the same time
+        opened = asyncio.Event()
+        state = {'pending': connections}
+
+        def on_settled():
+            state['pending'] -= 1
+            if state['pending'] <= 0:
+                opened.set()
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[self.run_socket(on_settled, opened) for _ in range(connections)])
+        elapsed = time.perf_counter() - start
+
+        connect_times = [result['connect'] for result in results if result['connect'] is not None]
+        reply_times = [reply for result in results for reply in result['replies']]
+        return {'open': len(connect_times),
+                'failed': connections - len(connect_times) + sum(result['errors'] for result in results),
+                'connect_p50': statistics.median(connect_times) if connect_times else float(),
+                'connect_p95': percentile(connect_times, 95),
+                'reply_p50': statistics.median(reply_times) if reply_times else float(),
+                'reply_p95': percentile(reply_times, 95),
+                'throughput': len(reply_times) / elapsed if elapsed else float()}
+
+    async def run_socket(self, on_settled, opened):
+        result = {'connect': None, 'replies': [], 'errors': 0}
+        timeout = self.options['timeout']
+        settled = False
+
+        start = time.perf_counter()
+        try:
+            socket = await asyncio.wait_for(websockets.connect(self.options['url'],
+                                                               extra_headers={'token': self.token}),
+                                            timeout)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            on_settled()
+            return result
+
+        try:
+            message = json.loads(await asyncio.wait_for(socket.recv(), timeout))
+            if message.get('message') == 'connected':
+                result['connect'] = time.perf_counter() - start
+            settled = True
+            on_settled()
+            if result['connect'] is None:
+                return result
+
+            await asyncio.wait_for(opened.wait(), timeout * 10)
+            for _ in range(self.options['messages']):
+                sent = time.perf_counter()
+                try:
+                    await socket.send(self.options['payload'])
+                    await asyncio.wait_for(socket.recv(), timeout)
+                    result['replies'].append(time.perf_counter() - sent)
+                except (asyncio.TimeoutError, websockets.WebSocketException):
+                    result['errors'] += 1
+        except (asyncio.TimeoutError, websockets.WebSocketException):
+            if not settled:
+                on_settled()
+        finally:
+            await socket.close()
+
+        return result
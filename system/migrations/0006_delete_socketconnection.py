@@ -0,0 +1,16 @@
+# Generated by Django 3.1 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0005_outboxevent'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='SocketConnection',
+        ),
+    ]
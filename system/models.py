@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.forms.models import model_to_dict
 from django.utils.translation import gettext_lazy as _
 from channels.layers import get_channel_layer
@@ -46,10 +48,27 @@ class Setting(models.Model):
 post_save.connect(Setting.post_save, sender=Setting)
 
 
-class SocketConnection(models.Model):
-    user = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
-    channel = models.CharField(_('channel'), max_length=200, null=True, blank=True)
-    group = models.CharField(_('group'), max_length=200, null=True, blank=True)
+class OutboxStatus(models.TextChoices):
+    PENDING = 'pending', _('Pending')
+    SENDING = 'sending', _('Sending')
+    SENT = 'sent', _('Sent')
+    FAILED = 'failed', _('Failed')
+
+
+class OutboxEvent(models.Model):
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    kind = models.CharField(_('kind'), max_length=50, null=True, blank=True)
+    event = models.CharField(_('event'), max_length=200, null=True, blank=True)
+    payload = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=100, null=True, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.IntegerField(default=0, null=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        return f"{self.kind} : {self.event}"
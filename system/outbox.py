@@ -0,0 +1,218 @@
+import logging
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from system.models import OutboxEvent, OutboxStatus
+from rendershot_django.utils import send_update_email
+from rendershot_django.slack import notifier, get_slack_channel, DIGEST_ENTRIES_PER_MESSAGE
+
+logger = logging.getLogger('Outbox')
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5
+BACKOFF_MAX = 15 * 60
+
+# claimed events not recorded within this time belong to a crashed worker and are claimed again
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+
+RESULT_FIELDS = ['status', 'attempts', 'next_attempt', 'last_error', 'date_modified']
+
+# slack events queued within the same window are posted together as one digest per channel
+SLACK_DIGEST_INTERVAL = getattr(settings, 'SLACK_DIGEST_INTERVAL', 30)
+
+
+class OutboxKinds:
+    SLACK = 'slack'
+    EMAIL = 'email'
+    CHANNEL_LAYER = 'channel_layer'
+    SHARE_LINK = 'share_link'
+
+
+def enqueue(kind, event, payload, user=None, next_attempt=None):
+    """
+    store a side effect to be dispatched by the dispatch_outbox worker, saved in the
+    caller transaction so it is only sent when the triggering change is committed.
+    """
+    return OutboxEvent.objects.create(user=user, kind=kind, event=event, payload=payload,
+                                      next_attempt=next_attempt or timezone.now())
+
+
+def get_digest_window_end(interval=SLACK_DIGEST_INTERVAL):
+    timestamp = timezone.now().timestamp()
+    window_end = (int(timestamp // interval) + 1) * interval
+    return datetime.datetime.fromtimestamp(window_end, tz=datetime.timezone.utc)
+
+
+def enqueue_slack(event, popup_text, subject, data, model_type=None, user=None):
+    payload = {'popup_text': popup_text, 'subject': subject, 'data': data, 'model_type': model_type}
+    return enqueue(OutboxKinds.SLACK, event, payload, user=user, next_attempt=get_digest_window_end())
+
+
+def enqueue_email(event, user, context, subject, message):
+    payload = {'context': context, 'subject': subject, 'message': message}
+    return enqueue(OutboxKinds.EMAIL, event, payload, user=user)
+
+
+def enqueue_group_send(event, group, message, user=None):
+    return enqueue(OutboxKinds.CHANNEL_LAYER, event, {'group': group, 'message': message}, user=user)
+
+
+def enqueue_group_send_many(event, group, messages, user=None):
+    """ several messages to one group in a single outbox event, sent in order """
+    return enqueue(OutboxKinds.CHANNEL_LAYER, event, {'group': group, 'messages': messages}, user=user)
+
+
+def enqueue_send(event, channel, message, user=None):
+    return enqueue(OutboxKinds.CHANNEL_LAYER, event, {'channel': channel, 'message': message}, user=user)
+
+
+def enqueue_share_link(event, job):
+    return enqueue(OutboxKinds.SHARE_LINK, event, {'job_name': job.name}, user=job.user)
+
+
+def send_slack_digest(channel, outbox_events):
+    messages = [(outbox_event.payload['popup_text'], outbox_event.payload['subject'], outbox_event.payload['data'])
+                for outbox_event in outbox_events]
+    notifier.post_digest(channel, messages)
+
+
+def send_email(outbox_event):
+    payload = outbox_event.payload
+    send_update_email(outbox_event.user, payload['context'], payload['subject'], payload['message'])
+
+
+def send_channel_message(outbox_event):
+    channel_layer = get_channel_layer()
+    payload = outbox_event.payload
+    if payload.get('messages'):
+        for message in payload['messages']:
+            async_to_sync(channel_layer.group_send)(payload['group'], message)
+    elif payload.get('group'):
+        async_to_sync(channel_layer.group_send)(payload['group'], payload['message'])
+    else:
+        async_to_sync(channel_layer.send)(payload['channel'], payload['message'])
+
+
+def warm_share_link(outbox_event):
+    """ resolve the job output link ahead of the first page showing it, api errors are retried """
+    from system.dbx_utils import DropboxHandler
+
+    dbx = DropboxHandler(outbox_event.user)
+    dbx.get_share_link(dbx.get_job_output_path(outbox_event.payload['job_name']))
+
+
+handlers = {OutboxKinds.EMAIL: send_email,
+            OutboxKinds.CHANNEL_LAYER: send_channel_message,
+            OutboxKinds.SHARE_LINK: warm_share_link}
+
+
+def get_backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def set_failed(outbox_event, err):
+    outbox_event.attempts += 1
+    outbox_event.last_error = str(err)
+    if outbox_event.attempts >= MAX_ATTEMPTS:
+        outbox_event.status = OutboxStatus.FAILED
+        logger.error(f"outbox event failed : {outbox_event} >> {err}")
+        return
+
+    backoff = get_backoff(outbox_event.attempts)
+    retry_after = getattr(err, 'retry_after', None)
+    if retry_after:
+        backoff = max(backoff, datetime.timedelta(seconds=retry_after))
+
+    outbox_event.status = OutboxStatus.PENDING
+    outbox_event.next_attempt = timezone.now() + backoff
+    logger.warning(f"outbox event retry {outbox_event.attempts} : {outbox_event} >> {err}")
+
+
+def dispatch(outbox_event):
+    handler = handlers.get(outbox_event.kind)
+    try:
+        if not handler:
+            raise ValueError(f"no outbox handler registered for {outbox_event.kind}")
+        handler(outbox_event)
+    except Exception as err:
+        set_failed(outbox_event, err)
+        return False
+
+    outbox_event.status = OutboxStatus.SENT
+    return True
+
+
+def dispatch_slack(outbox_events):
+    channels = dict()
+    for outbox_event in outbox_events:
+        channel = get_slack_channel(outbox_event.payload.get('model_type'))
+        channels.setdefault(channel, []).append(outbox_event)
+
+    # one slack message per chunk, recorded on its own so a failed chunk never reposts the ones before it
+    for channel, channel_events in channels.items():
+        for start in range(0, len(channel_events), DIGEST_ENTRIES_PER_MESSAGE):
+            chunk = channel_events[start:start + DIGEST_ENTRIES_PER_MESSAGE]
+            try:
+                send_slack_digest(channel, chunk)
+            except Exception as err:
+                for outbox_event in chunk:
+                    set_failed(outbox_event, err)
+            else:
+                for outbox_event in chunk:
+                    outbox_event.status = OutboxStatus.SENT
+            save_results(chunk)
+
+
+def claim_pending(batch_size):
+    """
+    mark one batch of due events as sending and commit, the events are then sent
+    outside of any transaction. rows are locked with skip locked while claiming so
+    several workers can drain the outbox side by side.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        outbox_events = list(OutboxEvent.objects.select_for_update(skip_locked=True)
+                             .select_related('user')
+                             .filter(status__in=[OutboxStatus.PENDING, OutboxStatus.SENDING], next_attempt__lte=now)
+                             .order_by('id')[:batch_size])
+
+        OutboxEvent.objects.filter(pk__in=[outbox_event.pk for outbox_event in outbox_events]) \
+            .update(status=OutboxStatus.SENDING, next_attempt=now + CLAIM_TIMEOUT, date_modified=now)
+
+    return outbox_events
+
+
+def save_results(outbox_events):
+    now = timezone.now()
+    for outbox_event in outbox_events:
+        outbox_event.date_modified = now
+    OutboxEvent.objects.bulk_update(outbox_events, RESULT_FIELDS)
+
+
+def dispatch_pending(batch_size=50):
+    """ claim and dispatch one batch of due events, returns the number of events handled """
+    outbox_events = claim_pending(batch_size)
+
+    slack_events = []
+    for outbox_event in outbox_events:
+        if outbox_event.kind == OutboxKinds.SLACK:
+            slack_events.append(outbox_event)
+        else:
+            dispatch(outbox_event)
+            save_results([outbox_event])
+
+    if slack_events:
+        dispatch_slack(slack_events)
+
+    return len(outbox_events)
+
+
+def purge_sent(days=7):
+    threshold = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = OutboxEvent.objects.filter(status=OutboxStatus.SENT, date_modified__lt=threshold).delete()
+    return deleted
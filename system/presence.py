@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger('SystemSocket')
+
+# a crashed worker can not remove its channels, each channel expires unless its consumer refreshes it
+PRESENCE_TTL = getattr(settings, 'SOCKET_PRESENCE_TTL', 5 * 60)
+PRESENCE_HEARTBEAT = getattr(settings, 'SOCKET_PRESENCE_HEARTBEAT', 60)
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+
+    if _redis is None:
+        url = getattr(settings, 'SOCKET_PRESENCE_REDIS_URL', None)
+        if not url:
+            host = settings.CHANNEL_LAYERS['default']['CONFIG']['hosts'][0]
+            url = host if isinstance(host, str) else f'redis://{host[0]}:{host[1]}/0'
+        _redis = redis.Redis.from_url(url, socket_timeout=1)
+    return _redis
+
+
+def user_group(group, user_id):
+    return f'{group}.user.{user_id}'
+
+
+def get_presence_key(group, user_id):
+    # a sorted set of channels by last seen time, the older plain set keys expire on their own
+    return f'socket_presence_seen:{user_group(group, user_id)}'
+
+
+def add(group, user_id, channel_name):
+    """ add or refresh a channel, scored by the time it was last seen """
+    key = get_presence_key(group, user_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.zadd(key, {channel_name: time.time()})
+        # only drops the key once every channel of the user is gone
+        pipe.expire(key, PRESENCE_TTL)
+        pipe.execute()
+    except redis.RedisError as err:
+        logger.error(f'socket presence could not be added : {key} >> {err}')
+
+
+def remove(group, user_id, channel_name):
+    key = get_presence_key(group, user_id)
+    try:
+        get_redis().zrem(key, channel_name)
+    except redis.RedisError as err:
+        logger.error(f'socket presence could not be removed : {key} >> {err}')
+
+
+def count(group, user_id):
+    """ live channels of the user, channels not seen within the ttl are pruned first """
+    key = get_presence_key(group, user_id)
+    pipe = get_redis().pipeline()
+    pipe.zremrangebyscore(key, '-inf', time.time() - PRESENCE_TTL)
+    pipe.zcard(key)
+    return pipe.execute()[1]
+
+
+async def heartbeat(group, user_id, channel_name, interval=PRESENCE_HEARTBEAT):
+    """ refresh a channel while its consumer runs, started on connect and cancelled on disconnect """
+    while True:
+        await asyncio.sleep(interval)
+        await sync_to_async(add, thread_sensitive=False)(group, user_id, channel_name)
+
+
+def is_listening(group, user_id):
+    """
+    whether the user has an open socket in the group, assumed true when redis is
+    not reachable so updates are never dropped.
+    """
+    try:
+        return count(group, user_id) > 0
+    except redis.RedisError as err:
+        logger.error(f'socket presence could not be read : {user_group(group, user_id)} >> {err}')
+        return True
@@ -8,12 +8,18 @@ $(document).ready(function () {
         }
     });
 
+    load_account_chart();
+    $("#chart_year").change(load_account_chart);
+});
+
+function load_account_chart() {
     $.ajax({
         url: $("#chart").attr("data-url"),
+        data: {'year': $("#chart_year").val()},
         dataType: 'json',
         success: function (data) {
             Highcharts.chart("chart", data);
         }
     });
-});
+}
 
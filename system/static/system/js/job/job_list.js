@@ -47,8 +47,10 @@ socket.onmessage = function (e) {
     let data = JSON.parse(e.data);
     let actions = {
         'update_job': update_job,
+        'patch_job': patch_job,
         'add_job': add_job,
         'delete_job': delete_job,
+        'update_jobs': update_jobs,
         'set_change_plan': set_change_plan,
         'set_job_details': set_job_details,
         'set_job_error_reports': set_job_error_reports,
@@ -87,11 +89,55 @@ function update_job(data) {
 
 }
 
+function format_float(value, digits) {
+    // mirrors django floatformat, without digits one decimal place is shown only when needed
+    if (digits) {
+        return Number(value).toFixed(digits);
+    }
+    return String(parseFloat(Number(value).toFixed(1)));
+}
+
+function patch_job(data) {
+    let job_item = $('#job_item_' + data.job_id);
+    if (!job_item.length) {
+        return;
+    }
+
+    let job = data.data;
+    let status_cell;
+    let progress = format_float(job.progress, 0);
+    if (progress === '0' || progress === '100') {
+        status_cell = $('<span class="j_stat" data-toggle="tooltip" data-placement="top"></span>')
+            .addClass('job_' + job.status)
+            .attr('title', job.status_description)
+            .text(job.status_display_name);
+    } else {
+        let progress_value = format_float(job.progress);
+        status_cell = $('<div class="progress"></div>').append(
+            $('<div class="progress-bar" role="progressbar" aria-valuemin="0" aria-valuemax="100"></div>')
+                .addClass(job.status)
+                .css('width', progress_value + '%')
+                .attr('aria-valuenow', progress_value)
+                .append($('<div class="progress_label"></div>')
+                    .text(job.status_display_name + ' %' + progress_value)));
+    }
+
+    job_item.find('.job_status').html(status_cell);
+    job_item.find('.job_cost').text(format_float(job.cost) + ' USD');
+}
+
 function delete_job(data) {
     $('#job_item_' + data.job_id).remove();
 
 }
 
+function update_jobs(data) {
+    (data.jobs || []).forEach(update_job);
+    (data.deleted || []).forEach(function (job_id) {
+        delete_job({'job_id': job_id});
+    });
+}
+
 function request_pause_resume(job) {
     socket.send(JSON.stringify({
         'type': 'request_pause_resume',
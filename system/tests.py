@@ -0,0 +1,192 @@
+import time
+import asyncio
+from unittest import mock
+
+import dropbox.files
+
+from django.test import TestCase, SimpleTestCase
+from django.utils import timezone
+
+from job.tests import JobTestMixin
+from system import outbox, dbx_utils, presence
+from system.models import OutboxEvent, OutboxStatus
+from rendershot_django.slack import DIGEST_ENTRIES_PER_MESSAGE
+
+
+class ShareLinkCacheTestCase(JobTestMixin, TestCase):
+
+    def setUp(self):
+        super(ShareLinkCacheTestCase, self).setUp()
+        client_patcher = mock.patch.object(dbx_utils, 'get_dropbox_client')
+        self.client = client_patcher.start().return_value
+        self.addCleanup(client_patcher.stop)
+
+        self.client.sharing_get_shared_links.return_value.links = []
+        self.client.sharing_create_shared_link_with_settings.return_value.url = 'https://dropbox/scene'
+
+    def test_job_output_link_is_resolved_once(self):
+        dbx = dbx_utils.DropboxHandler(self.user)
+        dbx_utils.invalidate_share_link(dbx.get_job_output_path('scene'))
+
+        for _ in range(10):
+            self.assertEqual(dbx_utils.DropboxHandler(self.user).get_job_output_link('scene'), 'https://dropbox/scene')
+        self.assertEqual(self.client.sharing_create_shared_link_with_settings.call_count, 1)
+
+        dbx_utils.invalidate_share_link(dbx.get_job_output_path('scene'))
+        dbx.get_job_output_link('scene')
+        self.assertEqual(self.client.sharing_create_shared_link_with_settings.call_count, 2)
+
+    def test_warmed_link_is_read_from_the_shared_cache(self):
+        job = self.create_job(name='warm_scene')
+        dbx_utils.invalidate_share_link(dbx_utils.DropboxHandler(self.user).get_job_output_path(job.name))
+        outbox.enqueue_share_link('on_completed', job)
+
+        outbox.dispatch_pending()
+        self.assertEqual(self.client.sharing_create_shared_link_with_settings.call_count, 1)
+
+        with mock.patch.object(dbx_utils.DropboxHandler, 'resolve_share_link') as resolve_share_link:
+            self.assertEqual(dbx_utils.DropboxHandler(self.user).get_job_output_link(job.name), 'https://dropbox/scene')
+        self.assertFalse(resolve_share_link.called)
+
+    def test_revoked_link_without_path(self):
+        dbx = dbx_utils.DropboxHandler(self.user)
+        path = dbx.get_job_output_path('scene')
+        dbx_utils.invalidate_share_link(path)
+        revoked_link = mock.Mock(path=None, url='https://dropbox/old')
+        self.client.sharing_get_shared_links.side_effect = [mock.Mock(links=[revoked_link]), mock.Mock(links=[])]
+
+        self.assertEqual(dbx.get_share_link(path), 'https://dropbox/scene')
+        self.client.sharing_revoke_shared_link.assert_called_once_with('https://dropbox/old')
+
+    def test_completed_job_queues_link_warm_up(self):
+        job = self.create_job()
+        job.on_completed()
+
+        outbox_event = OutboxEvent.objects.get(kind=outbox.OutboxKinds.SHARE_LINK)
+        self.assertEqual(outbox_event.payload, {'job_name': job.name})
+
+
+class SourceIndexTestCase(JobTestMixin, TestCase):
+
+    def setUp(self):
+        super(SourceIndexTestCase, self).setUp()
+        client_patcher = mock.patch.object(dbx_utils, 'get_dropbox_client')
+        self.client = client_patcher.start().return_value
+        self.addCleanup(client_patcher.stop)
+
+        self.dbx = dbx_utils.DropboxHandler(self.user)
+        dbx_utils.invalidate_source_index(self.user)
+
+    def get_entry(self, path, deleted=False):
+        entry = mock.Mock(spec=dropbox.files.DeletedMetadata if deleted else dropbox.files.FileMetadata)
+        entry.path_lower = entry.path_display = f"{self.dbx.get_user_sources_path()}/{path}".lower()
+        entry.name = path.split('/')[-1]
+        entry.size = 1
+        entry.client_modified = None
+        return entry
+
+    def get_result(self, entries, cursor, has_more=False):
+        return mock.Mock(entries=entries, cursor=cursor, has_more=has_more)
+
+    def test_listing_follows_cursor_and_updates_incrementally(self):
+        self.client.files_list_folder.return_value = self.get_result([self.get_entry('project/a.ksp'),
+                                                                      self.get_entry('b.ksp')], 'page_1', True)
+        self.client.files_list_folder_continue.side_effect = [
+            self.get_result([self.get_entry('project/c.ksp'), self.get_entry('project/c.png')], 'page_2'),
+            self.get_result([self.get_entry('project/a.ksp', deleted=True),
+                             self.get_entry('other/d.ksp')], 'page_3'),
+        ]
+
+        files = self.dbx.get_list_of_source_files(['.ksp'])
+        self.assertEqual([source_file.name for source_file in files], ['a.ksp', 'c.ksp'])
+
+        files = dbx_utils.DropboxHandler(self.user).get_list_of_source_files(['.ksp'])
+        self.assertEqual([source_file.name for source_file in files], ['c.ksp', 'd.ksp'])
+        self.assertEqual(self.client.files_list_folder.call_count, 1)
+        self.client.files_list_folder_continue.assert_called_with('page_2')
+
+
+class OutboxDispatchTestCase(JobTestMixin, TestCase):
+
+    def enqueue_slack(self, count):
+        events = [outbox.enqueue_slack('job_added', f'job {index}', 'job', {'job': index}) for index in range(count)]
+        OutboxEvent.objects.update(next_attempt=timezone.now())
+        return events
+
+    @mock.patch.object(outbox, 'send_update_email')
+    def test_dispatch_marks_sent(self, send_update_email):
+        outbox_event = outbox.enqueue_email('job_completed', self.user, {}, 'subject', 'message')
+
+        self.assertEqual(outbox.dispatch_pending(), 1)
+
+        outbox_event.refresh_from_db()
+        self.assertEqual(outbox_event.status, OutboxStatus.SENT)
+        send_update_email.assert_called_once()
+        self.assertEqual(outbox.dispatch_pending(), 0)
+
+    @mock.patch.object(outbox, 'send_update_email', side_effect=Exception('smtp down'))
+    def test_failure_backs_off_then_fails(self, send_update_email):
+        outbox_event = outbox.enqueue_email('job_completed', self.user, {}, 'subject', 'message')
+
+        outbox.dispatch_pending()
+        outbox_event.refresh_from_db()
+        self.assertEqual(outbox_event.status, OutboxStatus.PENDING)
+        self.assertEqual(outbox_event.attempts, 1)
+        self.assertEqual(outbox_event.last_error, 'smtp down')
+        self.assertGreater(outbox_event.next_attempt, timezone.now())
+        self.assertEqual(outbox.dispatch_pending(), 0)
+
+        for _ in range(outbox.MAX_ATTEMPTS - 1):
+            OutboxEvent.objects.filter(pk=outbox_event.pk).update(next_attempt=timezone.now())
+            outbox.dispatch_pending()
+
+        outbox_event.refresh_from_db()
+        self.assertEqual(outbox_event.status, OutboxStatus.FAILED)
+        self.assertEqual(outbox_event.attempts, outbox.MAX_ATTEMPTS)
+
+    def test_abandoned_claim_is_retried(self):
+        outbox_event = outbox.enqueue_email('job_completed', self.user, {}, 'subject', 'message')
+        self.assertEqual(len(outbox.claim_pending(10)), 1)
+        self.assertEqual(outbox.claim_pending(10), [])
+
+        OutboxEvent.objects.filter(pk=outbox_event.pk).update(next_attempt=timezone.now())
+        self.assertEqual(len(outbox.claim_pending(10)), 1)
+
+    @mock.patch.object(outbox.notifier, 'post_digest', side_effect=[None, Exception('slack down')])
+    def test_slack_digest_records_each_chunk(self, post_digest):
+        events = self.enqueue_slack(30)
+
+        outbox.dispatch_pending()
+
+        self.assertEqual(post_digest.call_count, 2)
+        statuses = dict(OutboxEvent.objects.values_list('pk', 'status'))
+        sent = [outbox_event.pk for outbox_event in events[:DIGEST_ENTRIES_PER_MESSAGE]]
+        self.assertTrue(all(statuses[pk] == OutboxStatus.SENT for pk in sent))
+        self.assertTrue(all(statuses[outbox_event.pk] == OutboxStatus.PENDING
+                            for outbox_event in events[DIGEST_ENTRIES_PER_MESSAGE:]))
+
+
+class PresenceTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.key = presence.get_presence_key('jobs', 0)
+        presence.get_redis().delete(self.key)
+        self.addCleanup(presence.get_redis().delete, self.key)
+
+    def test_stale_channel_expires_while_others_are_live(self):
+        presence.add('jobs', 0, 'live_channel')
+        presence.add('jobs', 0, 'dead_channel')
+        presence.get_redis().zadd(self.key, {'dead_channel': time.time() - presence.PRESENCE_TTL - 1})
+
+        self.assertEqual(presence.count('jobs', 0), 1)
+        self.assertTrue(presence.is_listening('jobs', 0))
+
+        presence.remove('jobs', 0, 'live_channel')
+        self.assertFalse(presence.is_listening('jobs', 0))
+
+    def test_heartbeat_refreshes_channel(self):
+        with mock.patch.object(presence, 'add', side_effect=[None, asyncio.CancelledError]) as add:
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(presence.heartbeat('jobs', 0, 'live_channel', interval=0))
+        add.assert_called_with('jobs', 0, 'live_channel')
+        self.assertEqual(add.call_count, 2)
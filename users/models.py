@@ -6,7 +6,7 @@ from django.utils.translation import gettext_lazy as _
 import pytz
 from rest_framework.authtoken.models import Token
 
-from payment.models import PaymentStatus
+from payment.models import PaymentStatus, BalanceLedger
 from rendershot_django.utils import post_message_to_slack
 from system.dbx_utils import DropboxHandler
 
@@ -62,14 +62,26 @@ class Profile(models.Model):
 
     @property
     def balance(self):
-        jobs = self.user.job_set.all()
-        spent_amount = float()
-
-        for job in jobs:
-            spent_amount += job.cost
-
-        balance = self.credit - (spent_amount * self.user.profile.rate_multiplier)
-        return balance
+        return self.get_ledger_balance(BalanceLedger.for_user(self.user))
+
+    def get_ledger_balance(self, ledger, pending_spent=float()):
+        """ balance from a loaded ledger, with pending_spent not in the ledger instance yet """
+        return (self.credit or float()) - ((ledger.spent_amount + pending_spent) * self.rate_multiplier)
+
+    @classmethod
+    def get_accounts(cls, user_ids):
+        """ (profile, ledger) of several users keyed by user id, one query for the profiles and one for the ledgers """
+        ledgers = {ledger.user_id: ledger for ledger in BalanceLedger.objects.filter(user_id__in=user_ids)}
+        accounts = dict()
+        for profile in cls.objects.filter(user_id__in=user_ids).select_related('user'):
+            accounts[profile.user_id] = (profile, ledgers.get(profile.user_id) or BalanceLedger.for_user(profile.user))
+        return accounts
+
+    @classmethod
+    def get_balances(cls, user_ids):
+        """ balance of several users keyed by user id """
+        return {user_id: profile.get_ledger_balance(ledger)
+                for user_id, (profile, ledger) in cls.get_accounts(user_ids).items()}
 
     def is_network_rendering_allowed(self):
         return self.user.groups.filter(name='network_rendering').exists()
@@ -80,6 +92,7 @@ def update_user_profile(sender, instance, created, **kwargs):
     if created:
         Token.objects.create(user=instance)
         Profile.objects.create(user=instance)
+        BalanceLedger.objects.create(user=instance)
         # TODO disable for ingestion
         post_message_to_slack("New Registration",
                               f"New User : {instance.username} Registered",